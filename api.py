@@ -0,0 +1,111 @@
+"""
+API HTTP asíncrona del planificador. Las coordenadas van como [lat, lon]; los destinos
+también se pueden indicar por nombre de punto de interés.
+
+    GET  /health   estado y hora de la última foto de disponibilidad
+    POST /trip     {"origin": [lat, lon], "destination": [lat, lon] | "destination_name": str,
+                    "min_bikes": 1, "min_docks": 1, "geometry": false}
+    POST /tour     {"start": [lat, lon], "stops": [nombre, ...]}
+    GET  /metrics  métricas en formato Prometheus (con METRICAS=1)
+
+Uso: python api.py --port 8080
+"""
+import argparse
+import asyncio
+import json
+import math
+from functools import partial
+from aiohttp import web
+import metricas
+from disponibilidad import AvailabilityRefresher
+from historico import ForecasterUpdater
+from matrices import load_matrices
+from motor import estimate_stage, get_optimal_route_order, get_trip_details, trip_summary
+from sitios import load_sites
+
+def _json(data, status=200):
+    return web.json_response(data, status=status, dumps=lambda d: json.dumps(d, default=str, ensure_ascii=False))
+
+def _coords(value):
+    if not isinstance(value, (list, tuple)) or len(value) != 2: raise ValueError("las coordenadas deben ser [lat, lon]")
+    lat, lon = float(value[0]), float(value[1])
+    if not (math.isfinite(lat) and math.isfinite(lon) and -90 <= lat <= 90 and -180 <= lon <= 180): raise ValueError(f"coordenadas fuera de rango: [{lat}, {lon}]")
+    return (lat, lon)
+
+async def _body(request):
+    body = await request.json()
+    if not isinstance(body, dict): raise ValueError("el cuerpo debe ser un objeto JSON")
+    return body
+
+_SIN_DATOS = {'error': 'sin datos de disponibilidad todavía'}
+
+class PlannerAPI:
+    def __init__(self, refresher, sites, matrices=None, forecaster=None):
+        # `forecaster`: una previsión fija o un ForecasterUpdater que la recalcula en segundo plano
+        self.refresher, self.sites, self.matrices, self.forecaster = refresher, sites, matrices, forecaster
+
+    @property
+    def current_forecaster(self):
+        return self.forecaster.get() if isinstance(self.forecaster, ForecasterUpdater) else self.forecaster
+
+    def site_index(self, nombre):
+        pos = self.sites.positions.get(nombre)
+        if pos is None: raise ValueError(f"punto de interés desconocido: {nombre}")
+        return pos
+
+    async def health(self, request):
+        snapshot = self.refresher.get(timeout=0)
+        return _json({'status': 'ok' if not snapshot.empty else 'sin_datos', 'snapshot': snapshot.fetched_at, 'estaciones': len(snapshot.index)})
+
+    async def trip(self, request):
+        try:
+            body = await _body(request)
+            origin = _coords(body.get('origin'))
+            destination_name = body.get('destination_name')
+            destination = self.sites.stops[self.site_index(destination_name)].coords if destination_name is not None else _coords(body.get('destination'))
+            min_bikes, min_docks = int(body.get('min_bikes', 1)), int(body.get('min_docks', 1))
+        except (ValueError, KeyError, TypeError) as e:
+            return _json({'error': str(e)}, status=400)
+        snapshot = self.refresher.get(timeout=0)
+        if snapshot.empty: return _json(_SIN_DATOS, status=503)
+        trip = await asyncio.get_running_loop().run_in_executor(None, partial(get_trip_details, origin, destination, snapshot.index, min_bikes, min_docks, matrices=self.matrices, sites=(None, destination_name), forecaster=self.current_forecaster))
+        if body.get('geometry') and not trip.get('error'): return _json(trip)
+        return _json(trip_summary(trip), status=200 if not trip.get('error') else 422)
+
+    async def tour(self, request):
+        try:
+            body = await _body(request)
+            start = _coords(body.get('start'))
+            stops = tuple(self.site_index(nombre) for nombre in body.get('stops', []))
+            if len(stops) < 2: raise ValueError("se necesitan al menos 2 paradas")
+        except (ValueError, KeyError, TypeError) as e:
+            return _json({'error': str(e)}, status=400)
+        snapshot = self.refresher.get(timeout=0)
+        if snapshot.empty: return _json(_SIN_DATOS, status=503)
+        points_df = self.sites.frame(start, stops)
+        def plan():
+            ordered = get_optimal_route_order(points_df, self.matrices, snapshot.index)
+            rows = list(ordered.itertuples())
+            stages = [estimate_stage(a.nombre_centro, b.nombre_centro, (a.latitude, a.longitude), (b.latitude, b.longitude), snapshot.index, self.matrices) for a, b in zip(rows, rows[1:])]
+            return {'stops': ordered[['nombre_centro', 'latitude', 'longitude']].to_dict('records'), 'stages': stages}
+        return _json(await asyncio.get_running_loop().run_in_executor(None, plan))
+
+    async def metrics(self, request):
+        return web.Response(text=metricas.render_prometheus(), content_type='text/plain')
+
+def create_app(refresher=None, sites=None, matrices=None, forecaster=None):
+    refresher = refresher or AvailabilityRefresher().start()
+    if forecaster is None:
+        # Sin previsión fija, se recalcula en segundo plano cada vez que toca al llegar una foto
+        forecaster = ForecasterUpdater().start(); refresher.listeners.append(forecaster)
+    api = PlannerAPI(refresher, sites if sites is not None else load_sites("nuevos_centros.csv"), matrices if matrices is not None else load_matrices(), forecaster)
+    app = web.Application()
+    app.add_routes([web.get('/health', api.health), web.post('/trip', api.trip), web.post('/tour', api.tour), web.get('/metrics', api.metrics)])
+    return app
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="API HTTP del planificador de rutas Valenbisi")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8080)
+    args = parser.parse_args()
+    web.run_app(create_app(), host=args.host, port=args.port)
@@ -0,0 +1,56 @@
+"""
+Micro-benchmark de la búsqueda de estación más cercana.
+Compara el camino anterior (geodesic fila a fila con DataFrame.apply) con StationIndex
+sobre estaciones sintéticas repartidas por Valencia.
+
+Uso: python benchmarks/bench_estaciones.py
+"""
+import os
+import sys
+import timeit
+import numpy as np
+import pandas as pd
+from geopy.distance import geodesic
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from indice_estaciones import StationIndex, TOLERANCIA_DISTANCIA
+
+def estaciones_sinteticas(n=280, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'nombre_estacion': [f"Estación {i}" for i in range(n)],
+        'latitude': rng.uniform(39.43, 39.50, n), 'longitude': rng.uniform(-0.42, -0.33, n),
+        'bicis_disponibles': rng.integers(0, 20, n), 'bornes_libres': rng.integers(0, 20, n)})
+
+def find_closest_station_geodesic(target_coords, estaciones_df, min_required=1, criteria_col="bicis_disponibles"):
+    estaciones_validas = estaciones_df[estaciones_df[criteria_col] >= min_required].copy()
+    if estaciones_validas.empty: return None
+    estaciones_validas['distancia'] = estaciones_validas.apply(lambda r: geodesic(target_coords, (r['latitude'], r['longitude'])).m, axis=1)
+    return estaciones_validas.sort_values('distancia').iloc[0].to_dict()
+
+def main(n_consultas=200):
+    df = estaciones_sinteticas()
+    rng = np.random.default_rng(1)
+    consultas = list(zip(rng.uniform(39.43, 39.50, n_consultas), rng.uniform(-0.42, -0.33, n_consultas)))
+    t_build = timeit.timeit(lambda: StationIndex(df), number=20) / 20
+    index = StationIndex(df)
+
+    iguales, dentro_tolerancia = 0, 0
+    for q in consultas:
+        antes, ahora = find_closest_station_geodesic(q, df, 5), index.closest(q, 5)
+        iguales += antes['nombre_estacion'] == ahora['nombre_estacion']
+        d_ahora = geodesic(q, (ahora['latitude'], ahora['longitude'])).m
+        dentro_tolerancia += d_ahora <= antes['distancia'] * (1 + TOLERANCIA_DISTANCIA)
+
+    muestra = consultas[:20]
+    t_antes = timeit.timeit(lambda: [find_closest_station_geodesic(q, df, 5) for q in muestra], number=3) / (3 * len(muestra))
+    t_ahora = timeit.timeit(lambda: [index.closest(q, 5) for q in consultas], number=20) / (20 * len(consultas))
+
+    print(f"Estaciones: {len(df)} | consultas: {n_consultas}")
+    print(f"Construcción del índice:   {t_build * 1e3:8.3f} ms")
+    print(f"geodesic + apply:          {t_antes * 1e3:8.3f} ms/consulta")
+    print(f"StationIndex.closest:      {t_ahora * 1e3:8.3f} ms/consulta  (x{t_antes / t_ahora:.0f})")
+    print(f"Misma estación: {iguales}/{n_consultas} | dentro de la tolerancia ({TOLERANCIA_DISTANCIA:.1%}): {dentro_tolerancia}/{n_consultas}")
+
+if __name__ == "__main__":
+    main()
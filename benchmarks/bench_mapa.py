@@ -0,0 +1,40 @@
+"""
+Benchmark del renderizado de la capa de estaciones.
+Compara un MarkerCluster con un folium.Marker por estación (camino anterior) con la capa
+StationLayer precalculada, midiendo el tiempo de render del mapa y el tamaño del HTML.
+
+Uso: python benchmarks/bench_mapa.py
+"""
+import os
+import sys
+import timeit
+import folium
+from folium.plugins import MarkerCluster
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from bench_estaciones import estaciones_sinteticas
+from capa_estaciones import station_layer
+from disponibilidad import AvailabilitySnapshot
+
+def mapa_antes(valenbisi_data):
+    m = folium.Map(location=[39.47, -0.37], zoom_start=14)
+    cluster = MarkerCluster(name="Todas las Estaciones", overlay=True, control=True, show=False).add_to(m)
+    for _, row in valenbisi_data.iterrows():
+        folium.Marker(location=[row['latitude'], row['longitude']], tooltip=f"<b>{row.get('nombre_estacion', 'N/A')}</b><br>Bicis: {row.get('bicis_disponibles', 0)} | Bornes: {row.get('bornes_libres', 0)}", icon=folium.Icon(color="lightgray", icon_color="#666666", icon="bicycle", prefix="fa")).add_to(cluster)
+    return m.get_root().render()
+
+def mapa_ahora(snapshot):
+    m = folium.Map(location=[39.47, -0.37], zoom_start=14)
+    station_layer(snapshot).add_to(m)
+    return m.get_root().render()
+
+def main(repeticiones=10):
+    df = estaciones_sinteticas()
+    snapshot = AvailabilitySnapshot(df)
+    mapa_ahora(snapshot)  # la primera llamada calcula la capa y la deja en caché
+    for nombre, render in (("Marker por estación", lambda: mapa_antes(df)), ("StationLayer cacheada", lambda: mapa_ahora(snapshot))):
+        t = timeit.timeit(render, number=repeticiones) / repeticiones
+        print(f"{nombre:<22} {t * 1e3:8.1f} ms/render  {len(render().encode('utf-8')) / 1024:8.1f} KiB de HTML")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Memoria por sesión y asignaciones por ejecución del script con muchas sesiones simultáneas.
+
+Compara la representación anterior (st.cache_data devuelve una copia del DataFrame de puntos de
+interés en cada ejecución y cada sesión guarda su tour como DataFrame) con la tabla compartida
+de sitios.py (cada sesión guarda el punto de partida y una tupla de índices).
+
+Uso: python benchmarks/bench_memoria.py [sesiones]
+"""
+import os
+import pickle
+import sys
+import tempfile
+import tracemalloc
+import numpy as np
+import pandas as pd
+
+RAIZ = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, RAIZ)
+from datos import load_centros
+from sitios import load_sites
+
+PARADAS = 6
+
+class SesionAntes:
+    def __init__(self, cache):
+        self.cache = cache  # bytes que guarda st.cache_data, compartidos por todas las sesiones
+        self.state = {}
+
+    def centros(self): return pickle.loads(self.cache)
+
+    def planificar(self, start, nombres):
+        centros_df = self.centros()
+        start_point_df = pd.DataFrame([{'nombre_centro': 'PUNTO DE PARTIDA', 'latitude': start[0], 'longitude': start[1], 'info_url': None}])
+        points = pd.concat([start_point_df, centros_df[centros_df['nombre_centro'].isin(nombres)]], ignore_index=True)
+        self.state['ordered_stops'] = points.iloc[[0] + list(range(len(points) - 1, 0, -1))].copy().reset_index(drop=True)
+
+    def ejecutar(self, etapa):
+        centros_df = self.centros()
+        options = [""] + sorted(centros_df['nombre_centro'].unique())
+        stops = self.state['ordered_stops']
+        current_stop, next_stop = stops.iloc[etapa], stops.iloc[etapa + 1]
+        return options, (current_stop['latitude'], current_stop['longitude']), (next_stop['latitude'], next_stop['longitude']), next_stop['nombre_centro']
+
+class SesionAhora:
+    def __init__(self, sites):
+        self.sites = sites  # st.cache_resource: la misma instancia para todas las sesiones
+        self.state = {}
+
+    def planificar(self, start, nombres):
+        self.state['tour_start'] = tuple(start)
+        self.state['ordered_stops'] = self.sites.indices(nombres)[::-1]
+
+    def ejecutar(self, etapa):
+        options = [""] + list(self.sites.sorted_names)
+        stops = self.sites.tour(self.state['tour_start'], self.state['ordered_stops'])
+        current_stop, next_stop = stops[etapa], stops[etapa + 1]
+        return options, current_stop.coords, next_stop.coords, next_stop.nombre_centro
+
+def medir(crear, sesiones, nombres, rng):
+    tracemalloc.start()
+    base, _ = tracemalloc.get_traced_memory()
+    usuarios = [crear() for _ in range(sesiones)]
+    for u in usuarios: u.planificar((rng.uniform(39.44, 39.49), rng.uniform(-0.41, -0.34)), list(rng.choice(nombres, PARADAS - 1, replace=False)))
+    estado, _ = tracemalloc.get_traced_memory()
+    # Una ejecución del script por sesión (la navegación de una etapa), con lo que usa la página aún vivo
+    antes = tracemalloc.take_snapshot()
+    tracemalloc.reset_peak()
+    vivos = [u.ejecutar(int(rng.integers(PARADAS - 1))) for u in usuarios]
+    _, pico = tracemalloc.get_traced_memory()
+    despues = tracemalloc.take_snapshot()
+    bloques = sum(max(0, s.count_diff) for s in despues.compare_to(antes, 'lineno'))
+    tracemalloc.stop()
+    del vivos
+    return {'estado_kib': (estado - base) / sesiones / 1024, 'bloques': bloques / sesiones, 'pico_kib': (pico - estado) / sesiones / 1024}
+
+def main(sesiones=200):
+    cache = pickle.dumps(load_centros(os.path.join(RAIZ, "nuevos_centros.csv")))
+    with tempfile.TemporaryDirectory() as directorio:
+        sites = load_sites(os.path.join(RAIZ, "nuevos_centros.csv"), directorio)
+        nombres = np.array(sites.names)
+        print(f"{sesiones} sesiones, tour de {PARADAS} paradas, {len(sites)} puntos de interés")
+        print(f"{'':<28} {'estado KiB/sesión':>18} {'bloques/ejecución':>18} {'pico KiB/ejecución':>19}")
+        for nombre, crear in (("DataFrames por sesión", lambda: SesionAntes(cache)), ("Tabla compartida + índices", lambda: SesionAhora(sites))):
+            r = medir(crear, sesiones, nombres, np.random.default_rng(0))
+            print(f"{nombre:<28} {r['estado_kib']:18.1f} {r['bloques']:18.0f} {r['pico_kib']:19.1f}")
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
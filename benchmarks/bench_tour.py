@@ -0,0 +1,49 @@
+"""
+Benchmark del orden de visita del tour.
+Compara el vecino más cercano anterior (geodesic en Python puro) con solve_tour
+sobre subconjuntos aleatorios de los puntos de interés de nuevos_centros.csv.
+
+Uso: python benchmarks/bench_tour.py
+"""
+import os
+import sys
+import time
+import numpy as np
+from geopy.distance import geodesic
+
+RAIZ = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, RAIZ)
+from datos import load_centros
+from optimizador_tour import distance_matrix_km, path_cost, solve_tour
+
+def greedy_geodesic(coords):
+    num_points = len(coords)
+    dist_matrix = [[0] * num_points for _ in range(num_points)]
+    for i in range(num_points):
+        for j in range(i + 1, num_points):
+            dist_matrix[i][j] = dist_matrix[j][i] = geodesic(coords[i], coords[j]).km
+    current_idx, path = 0, [0]
+    unvisited = list(range(1, num_points))
+    while unvisited:
+        next_idx = min(unvisited, key=lambda x: dist_matrix[current_idx][x])
+        path.append(next_idx); unvisited.remove(next_idx); current_idx = next_idx
+    return path
+
+def main(sizes=(5, 10, 20, 50, 90), repeticiones=5):
+    centros_df = load_centros(os.path.join(RAIZ, "nuevos_centros.csv"))
+    rng = np.random.default_rng(0)
+    print(f"{'paradas':>7} | {'antes km':>9} {'antes ms':>9} | {'ahora km':>9} {'ahora ms':>9} | mejora")
+    for n in sizes:
+        n = min(n, len(centros_df))
+        res = np.zeros((repeticiones, 4))
+        for r in range(repeticiones):
+            muestra = centros_df.iloc[rng.choice(len(centros_df), n, replace=False)]
+            lats, lons = muestra['latitude'].to_numpy(), muestra['longitude'].to_numpy()
+            t0 = time.perf_counter(); antes = greedy_geodesic(list(zip(lats, lons))); t1 = time.perf_counter()
+            cost = distance_matrix_km(lats, lons); ahora = solve_tour(cost); t2 = time.perf_counter()
+            res[r] = path_cost(antes, cost), (t1 - t0) * 1e3, path_cost(ahora, cost), (t2 - t1) * 1e3
+        km_antes, ms_antes, km_ahora, ms_ahora = res.mean(axis=0)
+        print(f"{n:>7} | {km_antes:>9.2f} {ms_antes:>9.1f} | {km_ahora:>9.2f} {ms_ahora:>9.1f} | {1 - km_ahora / km_antes:6.1%}")
+
+if __name__ == "__main__":
+    main()
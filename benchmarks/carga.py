@@ -0,0 +1,237 @@
+"""
+Benchmarks de regresión y prueba de carga contra el servidor falso (servidor_falso.py).
+
+Mide búsqueda de estaciones, orden del tour con varios tamaños, planificación de viajes,
+carga del CSV de puntos de interés, renderizado del mapa, refresco de disponibilidad, ingesta
+de recursos turísticos (obtener_datos_api.py) y ejecuciones completas de app.py con AppTest. Después simula sesiones concurrentes: cada una
+es un hilo (como Streamlit) que repite lo que hace un usuario en la app (geocodificar, planificar
+un viaje y pintarlo, ordenar un tour y recorrer sus etapas) sobre los recursos compartidos.
+
+Los resultados se guardan en benchmarks/resultados/<commit>.json para comparar entre commits.
+
+Uso:
+    python benchmarks/carga.py [--latencia 50] [--sesiones 1 4 16] [--rapido]
+    python benchmarks/carga.py --comparar [base.json] [nuevo.json]
+"""
+import argparse
+import contextlib
+import glob
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+import numpy as np
+
+RAIZ = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+RESULTADOS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "resultados")
+sys.path.insert(0, RAIZ)
+from servidor_falso import FakeAPIServer
+
+def resumen(tiempos_s, duracion_s=None):
+    t = np.asarray(tiempos_s) * 1e3
+    res = {'n': len(t), 'p50_ms': float(np.percentile(t, 50)), 'p95_ms': float(np.percentile(t, 95)), 'media_ms': float(t.mean())}
+    if duracion_s: res['por_segundo'] = len(t) / duracion_s
+    return res
+
+def medir(fn, args_list):
+    tiempos = []
+    for args in args_list:
+        inicio = time.perf_counter(); fn(*args); tiempos.append(time.perf_counter() - inicio)
+    return resumen(tiempos)
+
+def configurar_entorno(servidor, directorio):
+    # Los módulos leen estas variables al importarse, así que se fijan antes de importar nada del repo
+    os.environ.update({
+        'OSRM_BASE_URL': servidor.url, 'VALENBISI_URL': f"{servidor.url}/valenbisi", 'OPENCAGE_DOMAIN': servidor.domain, 'OPENCAGE_KEY': 'benchmark',
+        'ROUTE_CACHE_PATH': os.path.join(directorio, "rutas.sqlite"), 'GEOCODE_CACHE_PATH': os.path.join(directorio, "geocodificacion.sqlite"),
+        'HISTORICO_DIR': os.path.join(directorio, "historico"), 'MATRICES_DIR': os.path.join(directorio, "matrices"),
+        'SITIOS_DIR': os.path.join(directorio, "sitios"),
+    })
+
+def puntos_aleatorios(rng, n):
+    return list(zip(rng.uniform(39.44, 39.49, n), rng.uniform(-0.41, -0.34, n)))
+
+def benchmarks_unitarios(servidor, rapido=False):
+    import folium
+    from capa_estaciones import station_layer
+    from datos import load_centros
+    from disponibilidad import AvailabilityRefresher
+    from motor import find_closest_station, get_optimal_route_order, get_trip_details
+    from sitios import load_sites
+    rng = np.random.default_rng(0)
+    repeticiones = 5 if rapido else 20
+    resultados = {}
+
+    refresher = AvailabilityRefresher()
+    resultados['valenbisi_refresh'] = medir(refresher.refresh, [()] * (2 if rapido else 5))
+    snapshot = refresher.get()
+    index = snapshot.index
+    resultados['station_lookup'] = medir(find_closest_station, [(p, index, 3) for p in puntos_aleatorios(rng, 200 if rapido else 2000)])
+
+    csv_path = os.path.join(RAIZ, "nuevos_centros.csv")
+    resultados['csv_load'] = medir(load_centros, [(csv_path,)] * repeticiones)
+    sites = load_sites(csv_path)
+    for n in (5, 10, 20, 50):
+        muestras = [(sites.frame((39.47, -0.376), tuple(rng.choice(len(sites), n - 1, replace=False))),) for _ in range(repeticiones)]
+        resultados[f'tour_order_{n}'] = medir(get_optimal_route_order, muestras)
+
+    # Viajes en frío (tramos nuevos contra el servidor) y en caliente (caché de rutas)
+    viajes = [(a, b, index, 1, 1) for a, b in zip(puntos_aleatorios(rng, repeticiones), puntos_aleatorios(rng, repeticiones))]
+    resultados['trip_planning_cold'] = medir(get_trip_details, viajes)
+    resultados['trip_planning_warm'] = medir(get_trip_details, viajes)
+
+    trip = get_trip_details(*viajes[0])
+    def render_map():
+        m = folium.Map(location=viajes[0][0], zoom_start=15)
+        station_layer(snapshot).add_to(m)
+        for geom in trip.get('geoms', {}).values(): folium.PolyLine([(p[1], p[0]) for p in geom['coordinates']]).add_to(m)
+        return m.get_root().render()
+    resultados['map_render'] = medir(render_map, [()] * repeticiones)
+    return resultados, refresher, sites
+
+def benchmark_app(repeticiones=3):
+    """Ejecuciones completas de app.py (carga inicial y cálculo de un viaje) con AppTest, en serie."""
+    from streamlit.testing.v1 import AppTest
+    cargas, viajes = [], []
+    for i in range(repeticiones):
+        at = AppTest.from_file(os.path.join(RAIZ, "app.py"), default_timeout=120)
+        inicio = time.perf_counter(); at.run(); cargas.append(time.perf_counter() - inicio)
+        at.text_input(key="addr_tab1").input(f"Calle de Colón {i + 1}")
+        at.selectbox(key="dest_tab1_widget").select_index(i + 1).run()
+        inicio = time.perf_counter(); at.button[0].click().run(); viajes.append(time.perf_counter() - inicio)
+        if at.exception: raise RuntimeError(at.exception[0].value)
+    return {'app_first_run': resumen(cargas), 'app_trip_rerun': resumen(viajes)}
+
+def benchmark_ingesta(servidor, directorio, repeticiones=3):
+    """Ingesta de recursos turísticos contra el endpoint /turismo del servidor falso: completa e incremental."""
+    import pandas as pd
+    from obtener_datos_api import generar_datos_desde_api
+    completas, incrementales = [], []
+    for i in range(repeticiones):
+        path = os.path.join(directorio, f"recursos_turisticos_{i}.parquet")
+        ingesta = lambda **kwargs: generar_datos_desde_api(output_parquet=path, api_url=f"{servidor.url}/turismo", peticiones_por_segundo=0, **kwargs)
+        with contextlib.redirect_stdout(io.StringIO()):
+            inicio = time.perf_counter(); ok = ingesta(); completas.append(time.perf_counter() - inicio)
+            inicio = time.perf_counter(); ok = ingesta(incremental=True) and ok; incrementales.append(time.perf_counter() - inicio)
+        if not ok or len(pd.read_parquet(path)) != len(servidor.turismo): raise RuntimeError("la ingesta contra el servidor falso no ha descargado todos los recursos")
+    return {'ingesta_completa': resumen(completas), 'ingesta_incremental': resumen(incrementales)}
+
+def sesion_simulada(i, refresher, sites, geocoder, acciones):
+    """Lo que hace un usuario en la app, midiendo cada acción en `acciones[nombre]`."""
+    import folium
+    from capa_estaciones import station_layer
+    from motor import get_optimal_route_order, get_trip_details
+    from plan_tour import TourPlan
+    rng = np.random.default_rng(i)
+    def medida(nombre, fn, *args, **kwargs):
+        inicio = time.perf_counter(); res = fn(*args, **kwargs); acciones.setdefault(nombre, []).append(time.perf_counter() - inicio)
+        return res
+    snapshot = refresher.get()
+    start = medida('geocode', geocoder.geocode, f"Calle {int(rng.integers(1, 10**6))}, Valencia")
+    destino = sites.stops[int(rng.integers(len(sites)))]
+    trip = medida('trip', get_trip_details, start, destino.coords, snapshot.index, 1, 1)
+    def render():
+        m = folium.Map(location=start, zoom_start=15); station_layer(snapshot).add_to(m)
+        for geom in (trip.get('geoms') or {}).values(): folium.PolyLine([(p[1], p[0]) for p in geom['coordinates']]).add_to(m)
+        return m.get_root().render()
+    medida('map_render', render)
+    paradas = sites.frame(start, tuple(rng.choice(len(sites), 5, replace=False)))
+    ordenadas = medida('tour_order', get_optimal_route_order, paradas)
+    plan = TourPlan(zip(ordenadas['latitude'], ordenadas['longitude']), get_trip_details)
+    plan.prefetch(snapshot)
+    for etapa in range(plan.num_stages): medida('tour_stage', plan.get, etapa, 1, snapshot)
+
+def prueba_carga(refresher, sites, concurrencias, sesiones_por_hilo):
+    from geocodificacion import Geocoder
+    from opencage.geocoder import OpenCageGeocode
+    opencage = OpenCageGeocode(os.environ['OPENCAGE_KEY'], protocol='http', domain=os.environ['OPENCAGE_DOMAIN'])
+    def remoto(address):
+        res = opencage.geocode(address, limit=1)
+        return (res[0]['geometry']['lat'], res[0]['geometry']['lng']) if res else None
+    geocoder = Geocoder(remoto)
+    resultados = {}
+    for c in concurrencias:
+        acciones, sesiones = {}, []
+        def usuario(hilo):
+            for s in range(sesiones_por_hilo):
+                inicio = time.perf_counter(); sesion_simulada(c * 1000 + hilo * sesiones_por_hilo + s, refresher, sites, geocoder, acciones); sesiones.append(time.perf_counter() - inicio)
+        inicio = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=c) as executor: list(executor.map(usuario, range(c)))
+        duracion = time.perf_counter() - inicio
+        resultados[f'sesiones_{c}'] = {'sesion': resumen(sesiones, duracion), **{k: resumen(v) for k, v in acciones.items()}}
+    return resultados
+
+def commit_actual():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=RAIZ, capture_output=True, text=True, check=True).stdout.strip()
+        sucio = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=RAIZ, capture_output=True, text=True).stdout.strip())
+        return commit, sucio
+    except (OSError, subprocess.CalledProcessError): return "desconocido", False
+
+def guardar(resultados, config):
+    commit, sucio = commit_actual()
+    os.makedirs(RESULTADOS_DIR, exist_ok=True)
+    path = os.path.join(RESULTADOS_DIR, f"{commit}{'-sucio' if sucio else ''}.json")
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'commit': commit, 'sucio': sucio, 'fecha': datetime.now(timezone.utc).isoformat(), 'python': platform.python_version(), 'config': config, 'resultados': resultados}, f, indent=1)
+    return path
+
+def aplanar(resultados, prefijo=""):
+    filas = {}
+    for k, v in resultados.items():
+        if isinstance(v, dict) and 'p50_ms' in v: filas[prefijo + k] = v
+        elif isinstance(v, dict): filas.update(aplanar(v, f"{prefijo}{k}."))
+    return filas
+
+def comparar(base_path=None, nuevo_path=None):
+    ficheros = sorted(glob.glob(os.path.join(RESULTADOS_DIR, "*.json")), key=os.path.getmtime)
+    if base_path is None or nuevo_path is None:
+        if len(ficheros) < 2: print("⚠️ Se necesitan al menos dos resultados guardados para comparar."); return False
+        base_path, nuevo_path = ficheros[-2], ficheros[-1]
+    with open(base_path, encoding='utf-8') as f: base = json.load(f)
+    with open(nuevo_path, encoding='utf-8') as f: nuevo = json.load(f)
+    a, b = aplanar(base['resultados']), aplanar(nuevo['resultados'])
+    print(f"{base['commit']} -> {nuevo['commit']}")
+    print(f"{'medida':<34} {'p50 antes':>10} {'p50 ahora':>10} {'p95 antes':>10} {'p95 ahora':>10} {'cambio p50':>10}")
+    for k in sorted(set(a) & set(b)):
+        cambio = (b[k]['p50_ms'] / a[k]['p50_ms'] - 1) * 100 if a[k]['p50_ms'] else 0.0
+        print(f"{k:<34} {a[k]['p50_ms']:10.2f} {b[k]['p50_ms']:10.2f} {a[k]['p95_ms']:10.2f} {b[k]['p95_ms']:10.2f} {cambio:+9.1f}%")
+    return True
+
+def imprimir(resultados):
+    for k, v in aplanar(resultados).items():
+        extra = f"  {v['por_segundo']:7.2f} sesiones/s" if 'por_segundo' in v else ""
+        print(f"{k:<34} n={v['n']:<5} p50 {v['p50_ms']:9.2f} ms  p95 {v['p95_ms']:9.2f} ms{extra}")
+
+def main(latencia=50, jitter=10, concurrencias=(1, 4, 16), sesiones_por_hilo=3, rapido=False, app=True):
+    servidor = FakeAPIServer(latency_ms=latencia, jitter_ms=jitter).start()
+    with tempfile.TemporaryDirectory() as directorio:
+        configurar_entorno(servidor, directorio)
+        resultados, refresher, sites = benchmarks_unitarios(servidor, rapido)
+        resultados.update(benchmark_ingesta(servidor, directorio, 2 if rapido else 3))
+        if app: resultados.update(benchmark_app(2 if rapido else 3))
+        resultados['carga'] = prueba_carga(refresher, sites, concurrencias, sesiones_por_hilo)
+        resultados['peticiones_servidor'] = dict(servidor.requests)
+    servidor.stop()
+    imprimir(resultados)
+    path = guardar(resultados, {'latencia_ms': latencia, 'jitter_ms': jitter, 'concurrencias': list(concurrencias), 'sesiones_por_hilo': sesiones_por_hilo, 'rapido': rapido})
+    print(f"✅ Resultados guardados en '{path}'.")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks y prueba de carga con APIs simuladas")
+    parser.add_argument("--latencia", type=float, default=50, help="latencia de cada respuesta del servidor falso (ms)")
+    parser.add_argument("--jitter", type=float, default=10, help="latencia extra aleatoria máxima (ms)")
+    parser.add_argument("--sesiones", type=int, nargs="+", default=[1, 4, 16], help="niveles de concurrencia")
+    parser.add_argument("--sesiones-por-hilo", type=int, default=3)
+    parser.add_argument("--rapido", action="store_true", help="menos repeticiones")
+    parser.add_argument("--sin-app", action="store_true", help="omite las ejecuciones de app.py con AppTest")
+    parser.add_argument("--comparar", nargs="*", metavar="RESULTADO", help="compara dos resultados (por defecto los dos últimos)")
+    args = parser.parse_args()
+    if args.comparar is not None: sys.exit(0 if comparar(*(args.comparar + [None, None])[:2]) else 1)
+    main(args.latencia, args.jitter, args.sesiones, args.sesiones_por_hilo, args.rapido, not args.sin_app)
@@ -0,0 +1,195 @@
+"""
+Servidor HTTP local que sustituye a las APIs externas en los benchmarks: opendatasoft
+(disponibilidad de Valenbisi v2.1 y recursos turísticos v1), OSRM (route y table) y OpenCage.
+Reproduce las respuestas grabadas en benchmarks/grabaciones/ y añade una latencia configurable.
+
+Sin grabaciones se generan respuestas deterministas: estaciones sintéticas, los recursos de
+nuevos_centros.csv y rutas en línea recta con el mismo rodeo y velocidades que motor.py.
+
+Uso:
+    python benchmarks/servidor_falso.py --port 8999 --latencia 80
+    python benchmarks/servidor_falso.py --grabar   (descarga respuestas reales a grabaciones/)
+
+Para apuntar la app al servidor: OSRM_BASE_URL=http://localhost:8999
+VALENBISI_URL=http://localhost:8999/valenbisi OPENCAGE_DOMAIN=localhost:8999
+"""
+import argparse
+import ast
+import hashlib
+import json
+import os
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+import numpy as np
+import pandas as pd
+
+RAIZ = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, RAIZ)
+from bench_estaciones import estaciones_sinteticas
+from indice_estaciones import haversine_m
+
+GRABACIONES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "grabaciones")
+VELOCIDADES_KMH = {'foot': 5.0, 'bike': 15.0}
+FACTOR_RODEO = 1.3
+# Respuesta 500 inyectada con FakeAPIServer.fallos
+FALLO = object()
+
+def _cargar(nombre):
+    try:
+        with open(os.path.join(GRABACIONES_DIR, nombre), encoding='utf-8') as f: return json.load(f)
+    except (OSError, ValueError): return None
+
+def registros_valenbisi(n=280, seed=0):
+    """Registros con el formato de la API v2.1 de disponibilidad (grabados o sintéticos)."""
+    grabados = _cargar("valenbisi.json")
+    if grabados: return grabados
+    df = estaciones_sinteticas(n, seed)
+    return [{"number": i + 1, "name": row.nombre_estacion, "address": f"Calle {i + 1}", "available": int(row.bicis_disponibles), "free": int(row.bornes_libres),
+             "total": int(row.bicis_disponibles + row.bornes_libres), "status": "OPEN", "geo_point_2d": {"lat": row.latitude, "lon": row.longitude}}
+            for i, row in enumerate(df.itertuples())]
+
+def registros_turismo():
+    """Registros con el formato de la API v1 de recursos turísticos (grabados o a partir de nuevos_centros.csv)."""
+    grabados = _cargar("turismo.json")
+    if grabados: return grabados
+    df = pd.read_csv(os.path.join(RAIZ, "nuevos_centros.csv"), encoding='utf-8-sig')
+    registros = []
+    for row in df.to_dict('records'):
+        fields = {k: v for k, v in row.items() if pd.notna(v)}
+        # En el CSV son texto: geo_point_2d "[lat, lon]" (JSON) y geo_shape un dict en repr de Python
+        if 'geo_point_2d' in fields: fields['geo_point_2d'] = json.loads(fields['geo_point_2d'])
+        if 'geo_shape' in fields: fields['geo_shape'] = ast.literal_eval(fields['geo_shape'])
+        registros.append({"recordid": row['globalid'], "fields": fields})
+    return registros
+
+def ruta_recta(profile, coords):
+    (lon1, lat1), (lon2, lat2) = coords[:2]
+    dist = float(haversine_m(lat1, lon1, np.array([lat2]), np.array([lon2]))[0]) * FACTOR_RODEO
+    return {"code": "Ok", "routes": [{"distance": dist, "duration": dist / 1000 / VELOCIDADES_KMH.get(profile, 15.0) * 3600,
+                                      "geometry": {"type": "LineString", "coordinates": [[lon1, lat1], [lon2, lat2]]}}]}
+
+def tabla_recta(profile, coords, sources, destinations):
+    lats, lons = np.array([c[1] for c in coords]), np.array([c[0] for c in coords])
+    dist = np.array([haversine_m(lats[s], lons[s], lats[destinations], lons[destinations]) for s in sources]) * FACTOR_RODEO
+    return {"code": "Ok", "durations": (dist / 1000 / VELOCIDADES_KMH.get(profile, 15.0) * 3600).tolist(), "distances": dist.tolist()}
+
+def geocodificacion(query):
+    # Punto determinista dentro de Valencia a partir del texto buscado
+    h = int(hashlib.sha1(query.encode('utf-8')).hexdigest()[:8], 16)
+    lat, lng = 39.43 + (h % 7000) / 1e5, -0.42 + (h // 7000 % 9000) / 1e5
+    return {"results": [{"geometry": {"lat": lat, "lng": lng}, "formatted": query}], "status": {"code": 200, "message": "OK"}, "total_results": 1}
+
+class FakeAPIServer:
+    """
+    Servidor en un hilo de fondo. `latency_ms` (+ `jitter_ms` aleatorio) se aplica a cada
+    respuesta; `requests` cuenta las peticiones recibidas por servicio y `paginas` guarda, por
+    servicio paginado, el `start`/`offset` de cada petición. Las páginas de `fallos[servicio]`
+    responden 500 una vez (para probar reintentos y reanudaciones).
+    """
+    def __init__(self, port=0, latency_ms=50, jitter_ms=0, seed=0):
+        self.latency_ms, self.jitter_ms = latency_ms, jitter_ms
+        self.valenbisi, self.turismo = registros_valenbisi(seed=seed), registros_turismo()
+        self.rutas = _cargar("rutas.json") or {}
+        self.requests, self.paginas, self.fallos = {}, {}, {}
+        self.lock = threading.Lock()
+        self.random = random.Random(seed)
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self): return f"http://127.0.0.1:{self.httpd.server_port}"
+
+    @property
+    def domain(self): return f"localhost:{self.httpd.server_port}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="servidor-falso", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown(); self.httpd.server_close()
+
+    def _falla(self, servicio, pagina):
+        # Anota la página pedida y dice si debe fallar (solo la primera vez)
+        with self.lock:
+            self.paginas.setdefault(servicio, []).append(pagina)
+            fallos = self.fallos.get(servicio, set())
+            if pagina not in fallos: return False
+            fallos.discard(pagina); return True
+
+    def respond(self, path, query):
+        parts = path.strip('/').split('/')
+        if parts[0] == 'valenbisi':
+            limit, offset = int(query.get('limit', 100)), int(query.get('offset', 0))
+            if self._falla('valenbisi', offset): return 'valenbisi', FALLO
+            return 'valenbisi', {"total_count": len(self.valenbisi), "results": self.valenbisi[offset:offset + limit]}
+        if parts[0] == 'turismo':
+            rows, start = int(query.get('rows', 10)), int(query.get('start', 0))
+            if self._falla('turismo', start): return 'turismo', FALLO
+            records = self.turismo
+            if 'q' in query:  # solo el filtro de la ingesta incremental: last_edited_date>="..."
+                desde = query['q'].split('>=')[1].strip('"')
+                records = [r for r in records if r['fields'].get('last_edited_date', '')[:19] >= desde]
+            return 'turismo', {"nhits": len(records), "records": records[start:start + rows]}
+        if parts[0] == 'geocode':
+            return 'opencage', geocodificacion(query.get('q', ''))
+        if parts[0] in ('route', 'table') and len(parts) >= 4:
+            profile, coords = parts[2], [tuple(map(float, c.split(','))) for c in parts[3].split(';')]
+            if parts[0] == 'route': return 'osrm_route', self.rutas.get(path) or ruta_recta(profile, coords)
+            sources = [int(i) for i in query['sources'].split(';')] if 'sources' in query else list(range(len(coords)))
+            destinations = [int(i) for i in query['destinations'].split(';')] if 'destinations' in query else list(range(len(coords)))
+            return 'osrm_table', tabla_recta(profile, coords, sources, destinations)
+        return None, None
+
+    def _handler(self):
+        server = self
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlsplit(self.path)
+                query = {k: v[0] for k, v in parse_qs(url.query).items()}
+                servicio, body = server.respond(url.path, query)
+                with server.lock:
+                    server.requests[servicio] = server.requests.get(servicio, 0) + 1
+                    espera = (server.latency_ms + server.random.uniform(0, server.jitter_ms)) / 1000
+                time.sleep(espera)
+                if body is FALLO:
+                    self.send_response(500); self.send_header("Content-Length", "0"); self.end_headers(); return
+                data = json.dumps(body if body is not None else {"error": "no encontrado"}).encode('utf-8')
+                self.send_response(200 if body is not None else 404)
+                self.send_header("Content-Type", "application/json"); self.send_header("Content-Length", str(len(data)))
+                self.end_headers(); self.wfile.write(data)
+            def log_message(self, *args): pass
+        return Handler
+
+def grabar():
+    """Descarga respuestas reales de las APIs para reproducirlas después."""
+    from datos import VALENBISI_URL, fetch_valenbisi_records
+    from obtener_datos_api import API_URL, DATASET
+    import requests
+    os.makedirs(GRABACIONES_DIR, exist_ok=True)
+    valenbisi = fetch_valenbisi_records(VALENBISI_URL)
+    res = requests.get(API_URL, params={"dataset": DATASET, "rows": 1000}, timeout=30); res.raise_for_status()
+    for nombre, datos in (("valenbisi.json", valenbisi), ("turismo.json", res.json().get('records', []))):
+        with open(os.path.join(GRABACIONES_DIR, nombre), 'w', encoding='utf-8') as f: json.dump(datos, f, ensure_ascii=False)
+    print(f"✅ Grabadas {len(valenbisi)} estaciones y {len(res.json().get('records', []))} recursos en '{GRABACIONES_DIR}'.")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Servidor local que imita opendatasoft, OSRM y OpenCage")
+    parser.add_argument("--port", type=int, default=8999)
+    parser.add_argument("--latencia", type=float, default=50, help="latencia por respuesta (ms)")
+    parser.add_argument("--jitter", type=float, default=0, help="latencia extra aleatoria máxima (ms)")
+    parser.add_argument("--grabar", action="store_true")
+    args = parser.parse_args()
+    if args.grabar: grabar(); sys.exit(0)
+    servidor = FakeAPIServer(args.port, args.latencia, args.jitter).start()
+    print(f"Servidor falso en {servidor.url} (latencia {args.latencia} ms). Ctrl+C para salir.")
+    try:
+        while True: time.sleep(3600)
+    except KeyboardInterrupt:
+        servidor.stop()
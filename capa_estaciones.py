@@ -0,0 +1,48 @@
+import html
+import json
+from functools import lru_cache
+from folium.plugins import MarkerCluster
+from folium.template import Template
+
+# Marcador e información de cada estación se generan en el navegador a partir de una fila
+# [lat, lon, tooltip], en lugar de serializar un folium.Marker + folium.Icon por estación.
+STATION_CALLBACK = """function (row) {
+    var icon = L.AwesomeMarkers.icon({icon: 'bicycle', prefix: 'fa', markerColor: 'lightgray', iconColor: '#666666'});
+    return L.marker(new L.LatLng(row[0], row[1]), {icon: icon}).bindTooltip(row[2]);
+}"""
+
+class StationLayer(MarkerCluster):
+    """
+    Capa de estaciones con los datos ya serializados a JSON, de modo que el mismo texto
+    se reutiliza en todos los mapas y sesiones que usan la misma foto de disponibilidad.
+    Como FastMarkerCluster, los marcadores se crean en el navegador con STATION_CALLBACK.
+    """
+    _template = Template(
+        """
+        {% macro script(this, kwargs) %}
+            var {{ this.get_name() }} = (function(){
+                var callback = {{ this.callback }};
+                var data = {{ this.data_json }};
+                var cluster = L.markerClusterGroup({{ this.options|tojavascript }});
+                for (var i = 0; i < data.length; i++) { callback(data[i]).addTo(cluster); }
+                cluster.addTo({{ this._parent.get_name() }});
+                return cluster;
+            })();
+        {% endmacro %}"""
+    )
+
+    def __init__(self, data_json, name=None, overlay=True, control=True, show=True, **kwargs):
+        super().__init__(name=name, overlay=overlay, control=control, show=show, **kwargs)
+        self.data_json, self.callback = data_json, STATION_CALLBACK
+
+@lru_cache(maxsize=4)
+def station_layer_json(snapshot):
+    """JSON de la capa de estaciones de una foto de disponibilidad; se calcula una sola vez por foto."""
+    df = snapshot.df
+    if df.empty: return "[]"
+    tooltips = [f"<b>{html.escape(str(n))}</b><br>Bicis: {b} | Bornes: {d}" for n, b, d in zip(df['nombre_estacion'], df['bicis_disponibles'], df['bornes_libres'])]
+    rows = [[round(float(lat), 6), round(float(lon), 6), t] for lat, lon, t in zip(df['latitude'], df['longitude'], tooltips)]
+    return json.dumps(rows, ensure_ascii=False, separators=(',', ':')).replace('</', '<\\/')
+
+def station_layer(snapshot):
+    return StationLayer(station_layer_json(snapshot), name="Todas las Estaciones", overlay=True, control=True, show=False)
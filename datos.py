@@ -0,0 +1,64 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+import requests
+from metricas import incr, span
+
+VALENBISI_URL = os.getenv("VALENBISI_URL", "https://valencia.opendatasoft.com/api/explore/v2.1/catalog/datasets/valenbisi-disponibilitat-valenbisi-dsiponibilidad/records")
+
+def load_centros(filepath):
+    """Lee el CSV (o Parquet) de puntos de interés y devuelve nombre, coordenadas y URL de información de cada centro."""
+    try:
+        df = pd.read_parquet(filepath) if str(filepath).endswith('.parquet') else pd.read_csv(filepath, encoding='utf-8')
+        required_cols = ['nombre', 'geo_point_2d', 'informacion_recurso']
+        if not all(col in df.columns for col in required_cols): return pd.DataFrame()
+        df = df.dropna(subset=required_cols)
+        # El Parquet de obtener_datos_api.py ya trae las coordenadas tipadas
+        if not {'latitude', 'longitude'}.issubset(df.columns):
+            coords = df['geo_point_2d'].str.strip('[]').str.split(',', expand=True)
+            df['latitude'] = pd.to_numeric(coords[0], errors='coerce')
+            df['longitude'] = pd.to_numeric(coords[1], errors='coerce')
+        df = df.dropna(subset=['latitude', 'longitude'])
+        df['nombre_centro'] = df['nombre'].str.replace(r'^\d+\s*-\s*', '', regex=True).str.strip()
+        df['info_url'] = df['informacion_recurso']
+        return df[['nombre_centro', 'latitude', 'longitude', 'info_url']].drop_duplicates(subset=['nombre_centro']).sort_values(by='nombre_centro').reset_index(drop=True)
+    except Exception: return pd.DataFrame()
+
+def fetch_valenbisi_records(base_url=VALENBISI_URL, session=None, page_size=100, max_workers=4):
+    """
+    Descarga todos los registros de disponibilidad. La primera página indica el total
+    (`total_count`) y el resto se piden en paralelo, así el listado no se trunca si crece la red.
+    Los errores de red se propagan para que el llamante decida si conserva los datos anteriores.
+    """
+    session = session or requests.Session()
+    def page(offset):
+        with span('valenbisi_page'):
+            res = session.get(base_url, params={"limit": page_size, "offset": offset}, timeout=15); res.raise_for_status()
+        incr('bytes_received', len(res.content), source='valenbisi')
+        return res.json()
+    first = page(0)
+    all_data = list(first.get("results", []))
+    total = first.get("total_count", len(all_data))
+    offsets = range(page_size, total, page_size)
+    if offsets and all_data:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for data in executor.map(page, offsets): all_data.extend(data.get("results", []))
+    return all_data
+
+def normalize_valenbisi(all_data, solo_abiertas=True):
+    """Convierte los registros de la API de Valenbisi en el DataFrame de estaciones que usa la app."""
+    if not all_data: return pd.DataFrame()
+    df = pd.json_normalize(all_data)
+    api_col_map = {"geo_point_2d.lat": "latitude", "geo_point_2d.lon": "longitude", "available": "bicis_disponibles", "name": "nombre_estacion_api", "number": "numero_estacion", "address": "direccion_estacion", "total": "capacidad_total", "free": "bornes_libres", "status": "status"}
+    df.rename(columns={k: v for k, v in api_col_map.items() if k in df.columns}, inplace=True)
+    if 'nombre_estacion_api' in df.columns: df['nombre_estacion'] = df['nombre_estacion_api']
+    elif 'numero_estacion' in df.columns: df['nombre_estacion'] = "Estación " + df['numero_estacion'].astype(str)
+    else: df['nombre_estacion'] = "Estación Desconocida"
+    if not all(col in df.columns for col in ["latitude", "longitude", "bicis_disponibles", "nombre_estacion", "bornes_libres"]): return pd.DataFrame()
+    for col in ["bicis_disponibles", "bornes_libres", "capacidad_total"]: df[col] = pd.to_numeric(df.get(col), errors='coerce').fillna(0).astype(int)
+    if solo_abiertas and "status" in df.columns: df = df[df['status'].astype(str).str.upper() == 'OPEN']
+    return df
+
+def fetch_valenbisi(base_url=VALENBISI_URL):
+    try: return normalize_valenbisi(fetch_valenbisi_records(base_url))
+    except (requests.exceptions.RequestException, ValueError): return pd.DataFrame()
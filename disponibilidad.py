@@ -0,0 +1,87 @@
+import threading
+import time
+from datetime import datetime, timezone
+import pandas as pd
+import requests
+from datos import VALENBISI_URL, fetch_valenbisi_records, normalize_valenbisi
+from indice_estaciones import StationIndex
+from metricas import incr, span
+
+REFRESH_INTERVAL_S = 300
+
+class AvailabilitySnapshot:
+    """
+    Foto inmutable de la disponibilidad de Valenbisi: DataFrame de estaciones, su índice y
+    el momento en que se descargó. Todas las sesiones comparten la misma instancia, así que
+    nadie debe modificar `df`.
+    """
+    __slots__ = ('df', 'index', 'fetched_at')
+
+    def __init__(self, df, fetched_at=None):
+        object.__setattr__(self, 'df', df)
+        object.__setattr__(self, 'index', StationIndex(df))
+        object.__setattr__(self, 'fetched_at', fetched_at)
+
+    def __setattr__(self, name, value): raise AttributeError("AvailabilitySnapshot es inmutable")
+
+    @property
+    def empty(self): return self.index.empty
+
+EMPTY_SNAPSHOT = AvailabilitySnapshot(pd.DataFrame())
+
+class AvailabilityRefresher:
+    """
+    Hilo de fondo (uno por proceso) que descarga la disponibilidad cada `interval` segundos y
+    publica un AvailabilitySnapshot nuevo. Si una descarga falla se sigue sirviendo la última
+    foto buena y se reintenta en el siguiente ciclo. Cada foto nueva se pasa a los `listeners`
+    (p. ej. HistoricalStore.append para guardar el histórico).
+    """
+    def __init__(self, interval=REFRESH_INTERVAL_S, base_url=VALENBISI_URL, listeners=()):
+        self.interval, self.base_url = interval, base_url
+        self.listeners = list(listeners)
+        self.session = requests.Session()
+        self.snapshot = None
+        self.last_error = None
+        self.ready = threading.Event()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def refresh(self):
+        try:
+            with span('valenbisi_refresh'): df = normalize_valenbisi(fetch_valenbisi_records(self.base_url, self.session))
+        except (requests.exceptions.RequestException, ValueError) as e:
+            self.last_error = e; incr('refresh', result='error'); return False
+        if df.empty:
+            self.last_error = ValueError("La API no devolvió estaciones"); incr('refresh', result='error'); return False
+        incr('refresh', result='ok')
+        self.snapshot, self.last_error = AvailabilitySnapshot(df, datetime.now(timezone.utc)), None
+        self.ready.set()
+        for listener in self.listeners:
+            try: listener(self.snapshot)
+            # Un fallo al guardar el histórico no debe impedir servir la foto nueva
+            except Exception: incr('external_errors', source='snapshot_listener')
+        return True
+
+    def run(self):
+        while not self.stopped.is_set():
+            started = time.monotonic()
+            self.refresh()
+            # Tras un fallo sin ninguna foto disponible se reintenta antes
+            wait = self.interval if self.snapshot is not None else min(self.interval, 15)
+            self.stopped.wait(max(0.0, wait - (time.monotonic() - started)))
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, name="valenbisi-refresher", daemon=True)
+            self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+
+    def get(self, timeout=20):
+        """Última foto publicada. Solo espera (hasta `timeout` s) si todavía no hay ninguna."""
+        snapshot = self.snapshot
+        if snapshot is not None: return snapshot
+        self.ready.wait(timeout)
+        return self.snapshot or EMPTY_SNAPSHOT
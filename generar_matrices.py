@@ -0,0 +1,31 @@
+import requests
+from datos import load_centros, fetch_valenbisi_records, normalize_valenbisi
+from matrices import MATRICES_DIR, build_matrices
+from rutas import RouteClient, RouteCache
+
+def generar_matrices(centros_csv="nuevos_centros.csv", output_dir=MATRICES_DIR):
+    """
+    Precalcula las matrices de distancia y duración a pie y en bici entre los puntos
+    de interés y todas las estaciones de Valenbisi, y las guarda en `output_dir`.
+    """
+    print("Generando matrices de distancias y duraciones...")
+    centros_df = load_centros(centros_csv)
+    try:
+        estaciones_df = normalize_valenbisi(fetch_valenbisi_records(), solo_abiertas=False)
+    except requests.exceptions.RequestException as e:
+        print(f"❌ Error al descargar las estaciones: {e}")
+        return False
+    if centros_df.empty or estaciones_df.empty or 'numero_estacion' not in estaciones_df.columns:
+        print("❌ No se pudieron cargar los puntos de interés o las estaciones.")
+        return False
+    try:
+        build_matrices(centros_df, estaciones_df, RouteClient(cache=RouteCache(":memory:")), output_dir)
+    except Exception as e:
+        print(f"\n❌ Error al calcular las matrices: {e}")
+        return False
+    print(f"✅ Matrices guardadas en '{output_dir}' ({len(centros_df)} puntos de interés, {len(estaciones_df)} estaciones).")
+    return True
+
+# --- Ejecución del script ---
+if __name__ == "__main__":
+    generar_matrices()
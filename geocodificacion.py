@@ -0,0 +1,106 @@
+import difflib
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from metricas import incr, span
+
+GEOCODE_CACHE_PATH = os.getenv("GEOCODE_CACHE_PATH", os.path.join(".cache", "geocodificacion.sqlite"))
+GEOCODE_TTL_S = 30 * 24 * 3600
+GEOCODE_MAX_ENTRIES = 20000
+# Similitud mínima (difflib) para aceptar un nombre conocido que no coincide exactamente
+FUZZY_CUTOFF = 0.9
+
+ABREVIATURAS = {'c': 'calle', 'cl': 'calle', 'av': 'avenida', 'avda': 'avenida', 'pl': 'plaza', 'pza': 'plaza', 'pg': 'paseo', 'po': 'paseo', 'ctra': 'carretera', 'n': '', 'no': '', 'num': ''}
+
+def normalize_address(address):
+    """Minúsculas, sin tildes ni signos de puntuación, abreviaturas expandidas y espacios simples."""
+    text = unicodedata.normalize('NFKD', str(address)).encode('ascii', 'ignore').decode('ascii').lower()
+    words = re.sub(r'[^a-z0-9]+', ' ', text).split()
+    return " ".join(w for w in (ABREVIATURAS.get(w, w) for w in words) if w)
+
+def normalize_place_name(name):
+    # Los nombres de estaciones y centros pueden llevar un prefijo numérico ("12_...", "9-...")
+    return normalize_address(re.sub(r'^\s*\d+\s*[-_]\s*', '', str(name)))
+
+class GeocodeCache:
+    """Caché persistente en SQLite con caducidad (TTL) y expulsión de las entradas menos usadas (LRU)."""
+    def __init__(self, path=GEOCODE_CACHE_PATH, ttl=GEOCODE_TTL_S, max_entries=GEOCODE_MAX_ENTRIES):
+        if path != ":memory:" and os.path.dirname(path): os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.ttl, self.max_entries = ttl, max_entries
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS geocodificacion (clave TEXT PRIMARY KEY, lat REAL, lon REAL, creado REAL, usado REAL)")
+        self.conn.commit()
+
+    def get(self, key):
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute("SELECT lat, lon, creado FROM geocodificacion WHERE clave = ?", (key,)).fetchone()
+            if row is None: return None
+            if now - row[2] > self.ttl:
+                self.conn.execute("DELETE FROM geocodificacion WHERE clave = ?", (key,)); self.conn.commit()
+                return None
+            self.conn.execute("UPDATE geocodificacion SET usado = ? WHERE clave = ?", (now, key)); self.conn.commit()
+        return (row[0], row[1])
+
+    def put(self, key, coords):
+        now = time.time()
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO geocodificacion VALUES (?, ?, ?, ?, ?)", (key, coords[0], coords[1], now, now))
+            self.conn.execute("DELETE FROM geocodificacion WHERE clave IN (SELECT clave FROM geocodificacion ORDER BY usado DESC LIMIT -1 OFFSET ?)", (self.max_entries,))
+            self.conn.commit()
+
+class Geocoder:
+    """
+    Geocodificador en capas: primero los nombres conocidos (puntos de interés y estaciones),
+    por coincidencia exacta o aproximada; después la caché persistente; y solo al final el
+    geocodificador remoto (`remote_fn(address) -> (lat, lon) | None`).
+    """
+    def __init__(self, remote_fn, cache=None, places=()):
+        self.remote_fn = remote_fn
+        self.cache = cache if cache is not None else GeocodeCache()
+        self.lock = threading.Lock()
+        self.counters = {'local_exact': 0, 'local_fuzzy': 0, 'cache_hit': 0, 'miss': 0, 'remote_error': 0}
+        self.set_places(places)
+
+    def set_places(self, places):
+        """`places` es un iterable de (nombre, lat, lon)."""
+        self.gazetteer = {normalize_place_name(nombre): (float(lat), float(lon)) for nombre, lat, lon in places}
+        self.gazetteer_keys = list(self.gazetteer)
+
+    def count(self, name):
+        with self.lock: self.counters[name] += 1
+        incr('cache', kind='geocodificacion', result=name)
+
+    def stats(self):
+        with self.lock: return dict(self.counters)
+
+    def lookup_local(self, key):
+        if key in self.gazetteer:
+            self.count('local_exact'); return self.gazetteer[key]
+        # Una dirección con número de portal no se aproxima a un nombre: va al geocodificador
+        if any(ch.isdigit() for ch in key): return None
+        match = difflib.get_close_matches(key, self.gazetteer_keys, n=1, cutoff=FUZZY_CUTOFF)
+        if match:
+            self.count('local_fuzzy'); return self.gazetteer[match[0]]
+        return None
+
+    def geocode(self, address):
+        if not address: return None
+        key = normalize_address(address)
+        if not key: return None
+        coords = self.lookup_local(key)
+        if coords: return coords
+        coords = self.cache.get(key)
+        if coords:
+            self.count('cache_hit'); return coords
+        self.count('miss')
+        try:
+            with span('geocode_remote'): coords = self.remote_fn(address)
+        except Exception:
+            self.count('remote_error'); return None
+        if coords: self.cache.put(key, coords)
+        return coords
@@ -0,0 +1,215 @@
+"""
+Histórico de disponibilidad de Valenbisi y previsión a corto plazo.
+
+Cada foto se guarda como un Parquet pequeño dentro de una partición por día
+(`HISTORICO_DIR/dia=AAAA-MM-DD/`). Cuando el día se cierra, sus fotos se compactan en un
+único `dia.parquet`, así que cargar 28 días es leer 28 ficheros. Las particiones más
+antiguas que `RETENCION_DIAS` se borran al ingerir.
+
+Uso como proceso de ingesta independiente: python historico.py
+"""
+import os
+import shutil
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+import numpy as np
+import pandas as pd
+from metricas import incr
+
+HISTORICO_DIR = os.getenv("HISTORICO_DIR", "historico")
+RETENCION_DIAS = int(os.getenv("HISTORICO_RETENCION_DIAS", "60"))
+ZONA = ZoneInfo("Europe/Madrid")
+MINUTOS_FRANJA = 15
+FRANJAS_DIA = 24 * 60 // MINUTOS_FRANJA
+# Fichero con todas las fotos de un día ya cerrado
+FICHERO_DIA = "dia.parquet"
+
+class HistoricalStore:
+    def __init__(self, directory=HISTORICO_DIR, retention_days=RETENCION_DIAS):
+        self.directory, self.retention_days = directory, retention_days
+        self.lock = threading.Lock()
+        self._partition = None
+
+    def append(self, snapshot):
+        """Añade una foto de disponibilidad al histórico. Se puede usar como listener del refresco."""
+        df = snapshot.df
+        if df.empty or snapshot.fetched_at is None or 'numero_estacion' not in df.columns: return None
+        fetched_at = snapshot.fetched_at.astimezone(timezone.utc)
+        rows = pd.DataFrame({
+            'timestamp': pd.Series(fetched_at, index=df.index).astype('datetime64[us, UTC]'),
+            'numero_estacion': df['numero_estacion'].astype(str),
+            'bicis_disponibles': df['bicis_disponibles'].astype('int16'),
+            'bornes_libres': df['bornes_libres'].astype('int16'),
+        })
+        partition = os.path.join(self.directory, f"dia={fetched_at:%Y-%m-%d}")
+        path = os.path.join(partition, f"foto_{fetched_at:%H%M%S}.parquet")
+        with self.lock:
+            os.makedirs(partition, exist_ok=True)
+            rows.to_parquet(path, index=False)
+            # Al arrancar y en cada cambio de día se compactan los días ya cerrados
+            if partition != self._partition: self.compact(today=fetched_at); self._partition = partition
+            self.prune(now=fetched_at)
+        return path
+
+    def partitions(self):
+        if not os.path.isdir(self.directory): return []
+        return sorted(d for d in os.listdir(self.directory) if d.startswith("dia="))
+
+    def prune(self, now=None):
+        limit = ((now or datetime.now(timezone.utc)) - timedelta(days=self.retention_days)).strftime('%Y-%m-%d')
+        for partition in self.partitions():
+            if partition[4:] < limit: shutil.rmtree(os.path.join(self.directory, partition), ignore_errors=True)
+
+    @staticmethod
+    def _fotos(folder):
+        return sorted(f for f in os.listdir(folder) if f.startswith("foto_") and f.endswith(".parquet"))
+
+    def compact(self, today=None):
+        """Junta en `FICHERO_DIA` las fotos sueltas de cada día anterior a `today` (UTC) y las borra."""
+        today = (today or datetime.now(timezone.utc)).astimezone(timezone.utc).strftime('%Y-%m-%d')
+        for partition in self.partitions():
+            if partition[4:] >= today: continue
+            folder = os.path.join(self.directory, partition)
+            fotos = self._fotos(folder)
+            if not fotos: continue
+            dia = os.path.join(folder, FICHERO_DIA)
+            frames = ([pd.read_parquet(dia)] if os.path.exists(dia) else []) + [pd.read_parquet(os.path.join(folder, f)) for f in fotos]
+            # Se escribe aparte y se renombra: quien lea a la vez ve las fotos sueltas o el día completo
+            pd.concat(frames, ignore_index=True).to_parquet(dia + ".tmp", index=False)
+            os.replace(dia + ".tmp", dia)
+            for f in fotos: os.remove(os.path.join(folder, f))
+
+    def _read_partition(self, folder):
+        for _ in range(2):
+            try:
+                if os.path.exists(os.path.join(folder, FICHERO_DIA)): return [pd.read_parquet(os.path.join(folder, FICHERO_DIA))]
+                return [pd.read_parquet(os.path.join(folder, f)) for f in self._fotos(folder)]
+            except FileNotFoundError:
+                continue  # otro proceso acaba de compactar la partición: se vuelve a leer ya compactada
+        return []
+
+    def load(self, since=None):
+        """Todas las fotos guardadas (desde `since`, si se indica) en un único DataFrame."""
+        frames = []
+        for partition in self.partitions():
+            if since is not None and partition[4:] < since.strftime('%Y-%m-%d'): continue
+            frames += self._read_partition(os.path.join(self.directory, partition))
+        if not frames: return pd.DataFrame(columns=['timestamp', 'numero_estacion', 'bicis_disponibles', 'bornes_libres'])
+        return pd.concat(frames, ignore_index=True)
+
+def franja(when):
+    """(día de la semana, franja del día) en hora local de Valencia de un datetime con zona horaria."""
+    local = when.astimezone(ZONA)
+    return local.weekday(), (local.hour * 60 + local.minute) // MINUTOS_FRANJA
+
+def franjas(timestamps):
+    """Versión vectorizada de `franja` para una columna de timestamps."""
+    local = pd.DatetimeIndex(pd.to_datetime(timestamps, utc=True)).tz_convert(ZONA)
+    return local.weekday.to_numpy(), (local.hour * 60 + local.minute).to_numpy() // MINUTOS_FRANJA
+
+class AvailabilityForecaster:
+    """
+    Previsión por estación basada en medias estacionales (día de la semana x franja de 15 min).
+    La previsión a `h` minutos es el valor actual más la variación media entre la franja actual
+    y la franja de llegada, así que no requiere más que indexar dos arrays en cada consulta.
+    """
+    def __init__(self, station_ids, seasonal):
+        self.station_pos = {str(n): i for i, n in enumerate(station_ids)}
+        self.seasonal = seasonal  # {'bicis_disponibles': array (n, 7, FRANJAS_DIA), 'bornes_libres': ...}
+        self._mappings = {}
+
+    @classmethod
+    def fit(cls, history):
+        """Calcula las medias estacionales a partir de un DataFrame de HistoricalStore.load(). None si no hay datos."""
+        if history.empty: return None
+        station_ids = sorted(history['numero_estacion'].astype(str).unique())
+        pos = pd.Series(range(len(station_ids)), index=station_ids)[history['numero_estacion'].astype(str)].to_numpy()
+        dow, slot = franjas(history['timestamp'])
+        flat = (pos * 7 + dow) * FRANJAS_DIA + slot
+        size = len(station_ids) * 7 * FRANJAS_DIA
+        counts = np.bincount(flat, minlength=size)
+        seasonal = {}
+        for col in ('bicis_disponibles', 'bornes_libres'):
+            sums = np.bincount(flat, weights=history[col].to_numpy(dtype=float), minlength=size)
+            with np.errstate(invalid='ignore', divide='ignore'): mean = sums / counts
+            seasonal[col] = mean.reshape(len(station_ids), 7, FRANJAS_DIA).astype(np.float32)
+        return cls(station_ids, seasonal)
+
+    def positions_for(self, station_index):
+        # Correspondencia filas del índice -> filas del modelo, calculada una vez por índice
+        key = id(station_index)
+        cached = self._mappings.get(key)
+        if cached is not None and cached[0] is station_index: return cached[1]
+        numeros = station_index.df['numero_estacion'] if 'numero_estacion' in station_index.df.columns else []
+        mapping = np.array([self.station_pos.get(str(n), -1) for n in numeros], dtype=int)
+        if len(self._mappings) > 8: self._mappings.clear()
+        self._mappings[key] = (station_index, mapping)
+        return mapping
+
+    def forecast(self, station_index, criteria_col, minutes_ahead, now=None):
+        """Contadores previstos de cada estación del índice dentro de `minutes_ahead` minutos (escalar o array)."""
+        current = station_index.counts[criteria_col].astype(float)
+        rows = self.positions_for(station_index)
+        now = now or datetime.now(timezone.utc)
+        dow_now, slot_now = franja(now)
+        local = now.astimezone(ZONA)
+        minuto_semana = local.weekday() * 24 * 60 + local.hour * 60 + local.minute + local.second / 60
+        minutes_ahead = np.broadcast_to(np.asarray(minutes_ahead, dtype=float), current.shape)
+        total = ((minuto_semana + minutes_ahead) // MINUTOS_FRANJA).astype(int)
+        dow_then, slot_then = (total // FRANJAS_DIA) % 7, total % FRANJAS_DIA
+        seasonal, known = self.seasonal[criteria_col], rows >= 0
+        safe_rows = np.where(known, rows, 0)
+        # Estaciones sin histórico (o franjas sin observaciones): se mantiene el valor actual
+        delta = np.where(known, seasonal[safe_rows, dow_then, slot_then] - seasonal[safe_rows, dow_now, slot_now], 0.0)
+        return np.maximum(current + np.nan_to_num(delta), 0.0)
+
+def load_forecaster(directory=HISTORICO_DIR, days=28):
+    store = HistoricalStore(directory)
+    return AvailabilityForecaster.fit(store.load(since=datetime.now(timezone.utc) - timedelta(days=days)))
+
+class ForecasterUpdater:
+    """
+    Previsión compartida que se recalcula en un hilo aparte. Como listener del refresco de
+    disponibilidad, lanza un recálculo cuando la actual tiene más de `max_age` segundos; mientras
+    tanto se sigue sirviendo la anterior (None hasta que termina la primera carga).
+    """
+    def __init__(self, directory=HISTORICO_DIR, days=28, max_age=3600):
+        self.directory, self.days, self.max_age = directory, days, max_age
+        self.forecaster, self.built_at = None, None
+        self.lock = threading.Lock()
+        self._thread = None
+
+    def get(self): return self.forecaster
+
+    def __call__(self, snapshot=None): self.update()
+
+    def update(self):
+        """Lanza el recálculo si toca y no hay otro en marcha. Devuelve el hilo que lo hace (o None)."""
+        with self.lock:
+            if self._thread is not None and self._thread.is_alive(): return self._thread
+            if self.built_at is not None and time.monotonic() - self.built_at < self.max_age: return None
+            self._thread = threading.Thread(target=self._rebuild, name="prevision", daemon=True)
+            self._thread.start()
+            return self._thread
+
+    def _rebuild(self):
+        try: self.forecaster = load_forecaster(self.directory, self.days)
+        except Exception: incr('external_errors', source='historico')  # se reintenta pasado `max_age`
+        self.built_at = time.monotonic()
+
+    def start(self):
+        self.update()
+        return self
+
+# --- Ejecución del script ---
+if __name__ == "__main__":
+    from disponibilidad import AvailabilityRefresher
+    store = HistoricalStore()
+    refresher = AvailabilityRefresher(listeners=[store.append]).start()
+    print(f"Guardando la disponibilidad en '{store.directory}' cada {refresher.interval} s (Ctrl+C para salir)...")
+    try:
+        while True: time.sleep(3600)
+    except KeyboardInterrupt:
+        refresher.stop()
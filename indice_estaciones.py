@@ -0,0 +1,68 @@
+import numpy as np
+
+# Radio medio de la Tierra (m). La distancia haversine sobre la esfera difiere de la
+# geodésica WGS84 que usa geopy en menos de un 0,5 % a la escala de Valencia, así que la
+# estación devuelta coincide con la de `geodesic` salvo cuando dos candidatas están a
+# menos de TOLERANCIA_DISTANCIA de diferencia relativa.
+RADIO_TIERRA_M = 6371008.8
+TOLERANCIA_DISTANCIA = 0.005
+
+def haversine_m(lat, lon, lats, lons):
+    """Distancia en metros desde (lat, lon) a cada punto de los arrays `lats`/`lons` (en grados)."""
+    lat, lon = np.radians(lat), np.radians(lon)
+    lats, lons = np.radians(lats), np.radians(lons)
+    a = np.sin((lats - lat) / 2) ** 2 + np.cos(lat) * np.cos(lats) * np.sin((lons - lon) / 2) ** 2
+    return 2 * RADIO_TIERRA_M * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+class StationIndex:
+    """
+    Índice de estaciones construido una vez por cada refresco de disponibilidad.
+    Guarda las coordenadas y los contadores como arrays de NumPy y resuelve las
+    búsquedas de k vecinos con máscaras, sin recorrer el DataFrame fila a fila.
+    """
+    def __init__(self, estaciones_df):
+        self.df = estaciones_df.reset_index(drop=True)
+        self.lats = self.df['latitude'].to_numpy(dtype=float) if not self.df.empty else np.empty(0)
+        self.lons = self.df['longitude'].to_numpy(dtype=float) if not self.df.empty else np.empty(0)
+        self.counts = {col: self.df[col].to_numpy() for col in ("bicis_disponibles", "bornes_libres") if col in self.df.columns}
+        # El índice se comparte entre sesiones e hilos: los arrays son de solo lectura
+        for array in (self.lats, self.lons, *self.counts.values()): array.setflags(write=False)
+        self.records = self.df.to_dict('records')
+        self.positions = {str(n): i for i, n in enumerate(self.df['numero_estacion'])} if 'numero_estacion' in self.df.columns else {}
+
+    @property
+    def empty(self): return len(self.records) == 0
+
+    def __len__(self): return len(self.records)
+
+    def distances(self, target_coords):
+        return haversine_m(target_coords[0], target_coords[1], self.lats, self.lons)
+
+    def nearest(self, target_coords, k=1, min_required=0, criteria_col=None, counts=None):
+        """
+        Posiciones de las `k` estaciones más cercanas que cumplen el mínimo, ordenadas por distancia.
+        `counts` sustituye a los contadores de la foto (p. ej. por los previstos a la hora de llegada).
+        """
+        if not target_coords or self.empty: return np.empty(0, dtype=int), np.empty(0)
+        dist = self.distances(target_coords)
+        if counts is None and criteria_col: counts = self.counts[criteria_col]
+        candidatas = np.flatnonzero(counts >= min_required) if counts is not None else np.arange(len(dist))
+        if candidatas.size == 0: return candidatas, np.empty(0)
+        if k < candidatas.size: candidatas = candidatas[np.argpartition(dist[candidatas], k - 1)[:k]]
+        candidatas = candidatas[np.argsort(dist[candidatas], kind='stable')]
+        return candidatas, dist[candidatas]
+
+    def station(self, pos, distancia=None):
+        estacion = dict(self.records[pos])
+        if distancia is not None: estacion['distancia'] = float(distancia)
+        return estacion
+
+    def find(self, numero_estacion):
+        """Registro actual de la estación con ese número, o None si ya no está en la foto."""
+        pos = self.positions.get(str(numero_estacion))
+        return None if pos is None else self.records[pos]
+
+    def closest(self, target_coords, min_required=1, criteria_col="bicis_disponibles", counts=None):
+        posiciones, distancias = self.nearest(target_coords, 1, min_required, criteria_col, counts)
+        if posiciones.size == 0: return None
+        return self.station(posiciones[0], distancias[0])
@@ -0,0 +1,43 @@
+"""
+Planificación por lotes de viajes (origen, destino) en varios procesos.
+Todos los procesos trabajan con la misma foto de disponibilidad, que se descarga una sola
+vez, y comparten la caché de rutas en disco de rutas.py.
+
+Entrada: CSV con columnas origin_lat, origin_lon, dest_lat, dest_lon.
+Uso: python lote.py viajes.csv resultados.csv --workers 8
+"""
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+from datos import fetch_valenbisi
+from indice_estaciones import StationIndex
+from motor import get_trip_details, trip_summary
+
+_station_index = None
+
+def _init_worker(estaciones_df):
+    global _station_index
+    _station_index = StationIndex(estaciones_df)
+
+def _plan_one(args):
+    origin, destination, min_bikes, min_docks = args
+    return trip_summary(get_trip_details(origin, destination, _station_index, min_bikes, min_docks))
+
+def plan_batch(trips_df, estaciones_df=None, workers=None, min_bikes=1, min_docks=1, chunksize=16):
+    """Planifica cada fila de `trips_df` y devuelve un DataFrame con el resumen de cada viaje."""
+    estaciones_df = fetch_valenbisi() if estaciones_df is None else estaciones_df
+    tasks = [((o_lat, o_lon), (d_lat, d_lon), min_bikes, min_docks) for o_lat, o_lon, d_lat, d_lon in zip(trips_df['origin_lat'], trips_df['origin_lon'], trips_df['dest_lat'], trips_df['dest_lon'])]
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count(), initializer=_init_worker, initargs=(estaciones_df,)) as executor:
+        results = list(executor.map(_plan_one, tasks, chunksize=chunksize))
+    return pd.concat([trips_df.reset_index(drop=True), pd.DataFrame(results)], axis=1)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Planificación por lotes de viajes en Valenbisi")
+    parser.add_argument("entrada"); parser.add_argument("salida")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--min-bikes", type=int, default=1); parser.add_argument("--min-docks", type=int, default=1)
+    args = parser.parse_args()
+    resultados = plan_batch(pd.read_csv(args.entrada), workers=args.workers, min_bikes=args.min_bikes, min_docks=args.min_docks)
+    resultados.to_csv(args.salida, index=False)
+    print(f"✅ {len(resultados)} viajes planificados ({resultados['error'].isna().sum()} sin errores) en '{args.salida}'.")
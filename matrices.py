@@ -0,0 +1,68 @@
+import json
+import os
+import numpy as np
+
+MATRICES_DIR = os.getenv("MATRICES_DIR", "matrices")
+# Cada fichero .npy guarda un array float32 de forma (2, n, m): [0] duración en minutos, [1] distancia en km.
+FICHEROS = {
+    'pie_sitios_estaciones': ('foot', 'sitios', 'estaciones'),
+    'pie_estaciones_sitios': ('foot', 'estaciones', 'sitios'),
+    'bici_estaciones': ('bike', 'estaciones', 'estaciones'),
+    'pie_sitios': ('foot', 'sitios', 'sitios'),
+}
+
+class TravelMatrices:
+    """
+    Matrices precalculadas de duración y distancia entre los puntos de interés y las estaciones.
+    Los arrays se abren con memory-map, así que cargar la app no lee los ficheros completos.
+    """
+    def __init__(self, directory=MATRICES_DIR):
+        with open(os.path.join(directory, "meta.json"), encoding='utf-8') as f: self.meta = json.load(f)
+        self.site_pos = {nombre: i for i, nombre in enumerate(self.meta['sitios'])}
+        self.station_pos = {str(numero): i for i, numero in enumerate(self.meta['estaciones'])}
+        self.arrays = {nombre: np.load(os.path.join(directory, f"{nombre}.npy"), mmap_mode='r') for nombre in FICHEROS}
+        # Si se abre justo mientras generar_matrices.py sustituye los ficheros, meta.json y los arrays pueden no casar
+        sizes = {'sitios': len(self.site_pos), 'estaciones': len(self.station_pos)}
+        for nombre, (_, origen, destino) in FICHEROS.items():
+            if self.arrays[nombre].shape[1:] != (sizes[origen], sizes[destino]): raise ValueError(f"{nombre}.npy no corresponde a meta.json")
+
+    def site(self, nombre_centro): return self.site_pos.get(nombre_centro)
+
+    def station(self, numero_estacion): return self.station_pos.get(str(numero_estacion))
+
+    def lookup(self, nombre, i, j):
+        if i is None or j is None: return None
+        time, dist = float(self.arrays[nombre][0, i, j]), float(self.arrays[nombre][1, i, j])
+        return None if np.isnan(time) else (dist, time)
+
+    def walk(self, site_a, site_b): return self.lookup('pie_sitios', self.site(site_a), self.site(site_b))
+
+    def estimate_trip(self, site_a, site_b, estacion_origen, estacion_destino):
+        """Distancia (km) y tiempo (min) de un viaje pie-bici-pie entre dos puntos de interés, sin llamadas de red."""
+        o, d = self.station(estacion_origen.get('numero_estacion')), self.station(estacion_destino.get('numero_estacion'))
+        legs = [self.lookup('pie_sitios_estaciones', self.site(site_a), o), self.lookup('bici_estaciones', o, d), self.lookup('pie_estaciones_sitios', d, self.site(site_b))]
+        if not all(legs): return None
+        return {'dists': {'pie1': legs[0][0], 'bici': legs[1][0], 'pie2': legs[2][0]}, 'times': {'pie1': legs[0][1], 'bici': legs[1][1], 'pie2': legs[2][1]}, 'total_dist': sum(leg[0] for leg in legs), 'total_time': sum(leg[1] for leg in legs)}
+
+def load_matrices(directory=MATRICES_DIR):
+    """Devuelve las matrices del directorio indicado, o None si todavía no se han generado."""
+    if not os.path.exists(os.path.join(directory, "meta.json")): return None
+    try: return TravelMatrices(directory)
+    except (OSError, ValueError, KeyError): return None
+
+def build_matrices(centros_df, estaciones_df, client, directory=MATRICES_DIR):
+    """
+    Calcula con el servicio `table` de OSRM todas las matrices de FICHEROS y las guarda en `directory`.
+    Todo se escribe antes en ficheros `.tmp` y se sustituye con os.replace, meta.json al final: los
+    procesos que ya tienen las matrices abiertas con memory-map siguen leyendo los ficheros anteriores.
+    """
+    os.makedirs(directory, exist_ok=True)
+    puntos = {'sitios': list(zip(centros_df['latitude'], centros_df['longitude'])), 'estaciones': list(zip(estaciones_df['latitude'], estaciones_df['longitude']))}
+    for nombre, (profile, origen, destino) in FICHEROS.items():
+        print(f"  ... Calculando {nombre} ({len(puntos[origen])} x {len(puntos[destino])}, perfil {profile})")
+        durations, distances = client.get_table(puntos[origen], puntos[destino], profile, use_cache=False)
+        with open(os.path.join(directory, f"{nombre}.npy.tmp"), 'wb') as f: np.save(f, np.stack([durations, distances]).astype(np.float32))
+    meta = {'sitios': centros_df['nombre_centro'].tolist(), 'estaciones': [str(n) for n in estaciones_df['numero_estacion']]}
+    with open(os.path.join(directory, "meta.json.tmp"), 'w', encoding='utf-8') as f: json.dump(meta, f, ensure_ascii=False)
+    for fichero in [f"{nombre}.npy" for nombre in FICHEROS] + ["meta.json"]:
+        os.replace(os.path.join(directory, f"{fichero}.tmp"), os.path.join(directory, fichero))
@@ -0,0 +1,114 @@
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Con METRICAS=1 se registran tiempos y contadores; si no, span() y timed() no hacen nada.
+ENABLED = os.getenv("METRICAS", "0") == "1"
+# Si se define, cada span terminado se escribe también como una línea JSON en este logger
+LOG_SPANS = os.getenv("METRICAS_LOG", "0") == "1"
+PROFILES_DIR = os.getenv("METRICAS_PERFILES", os.path.join(".cache", "perfiles"))
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+logger = logging.getLogger("metricas")
+_lock = threading.Lock()
+_histograms = {}
+_counters = {}
+_NULL = nullcontext()
+
+def observe(name, seconds):
+    with _lock:
+        hist = _histograms.get(name)
+        if hist is None: hist = _histograms[name] = {'buckets': [0] * len(BUCKETS), 'count': 0, 'sum': 0.0}
+        for i, limit in enumerate(BUCKETS):
+            if seconds <= limit: hist['buckets'][i] += 1
+        hist['count'] += 1; hist['sum'] += seconds
+    if LOG_SPANS: logger.info(json.dumps({'span': name, 'seconds': round(seconds, 6)}))
+
+@contextmanager
+def _span(name):
+    start = time.perf_counter()
+    try: yield
+    finally: observe(name, time.perf_counter() - start)
+
+def span(name):
+    """Context manager que mide la duración del bloque con el nombre `name`."""
+    return _span(name) if ENABLED else _NULL
+
+def timed(name):
+    """Decorador equivalente a `span`. Con las métricas desactivadas devuelve la función sin envolver."""
+    def decorator(fn):
+        if not ENABLED: return fn
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with _span(name): return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def incr(name, value=1, **labels):
+    """Suma `value` al contador `name` con las etiquetas indicadas (p. ej. incr('cache', kind='rutas', result='hit'))."""
+    if not ENABLED: return
+    key = (name, tuple(sorted(labels.items())))
+    with _lock: _counters[key] = _counters.get(key, 0) + value
+
+def snapshot():
+    with _lock:
+        return {'histograms': {k: {'buckets': list(v['buckets']), 'count': v['count'], 'sum': v['sum']} for k, v in _histograms.items()}, 'counters': dict(_counters)}
+
+def reset():
+    with _lock: _histograms.clear(); _counters.clear()
+
+def _labels(pairs):
+    return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}" if pairs else ""
+
+def render_prometheus():
+    """Métricas en formato de texto de Prometheus."""
+    data, lines = snapshot(), []
+    if data['histograms']:
+        lines += ["# HELP edm_span_seconds Duración de los tramos instrumentados.", "# TYPE edm_span_seconds histogram"]
+        for name, hist in sorted(data['histograms'].items()):
+            for limit, count in zip(BUCKETS, hist['buckets']): lines.append(f'edm_span_seconds_bucket{{span="{name}",le="{limit}"}} {count}')
+            lines.append(f'edm_span_seconds_bucket{{span="{name}",le="+Inf"}} {hist["count"]}')
+            lines.append(f'edm_span_seconds_sum{{span="{name}"}} {hist["sum"]:.6f}')
+            lines.append(f'edm_span_seconds_count{{span="{name}"}} {hist["count"]}')
+    names = sorted({name for name, _ in data['counters']})
+    for name in names:
+        lines.append(f"# TYPE edm_{name}_total counter")
+        for (n, labels), value in sorted(data['counters'].items()):
+            if n == name: lines.append(f"edm_{name}_total{_labels(labels)} {value}")
+    return "\n".join(lines) + "\n"
+
+def start_http_server(port, host="0.0.0.0"):
+    """Sirve /metrics en un hilo aparte. Devuelve el servidor para poder pararlo."""
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_response(404); self.end_headers(); return
+            body = render_prometheus().encode('utf-8')
+            self.send_response(200); self.send_header('Content-Type', 'text/plain; version=0.0.4'); self.send_header('Content-Length', str(len(body))); self.end_headers()
+            self.wfile.write(body)
+        def log_message(self, *args): pass
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name="metricas-http", daemon=True).start()
+    return server
+
+def start_profile():
+    profiler = cProfile.Profile(); profiler.enable()
+    return profiler
+
+def stop_profile(profiler, top=25):
+    """Detiene el perfil, lo guarda en PROFILES_DIR y devuelve las `top` funciones con más tiempo acumulado."""
+    profiler.disable()
+    os.makedirs(PROFILES_DIR, exist_ok=True)
+    path = os.path.join(PROFILES_DIR, f"perfil_{time.strftime('%Y%m%d_%H%M%S')}_{time.time_ns() % 10**9:09d}.prof")
+    profiler.dump_stats(path)
+    out = io.StringIO()
+    pstats.Stats(profiler, stream=out).sort_stats('cumulative').print_stats(top)
+    return path, out.getvalue()
@@ -0,0 +1,150 @@
+"""
+Núcleo de planificación de rutas, independiente de Streamlit y Folium. Lo usan la app,
+la API HTTP (api.py) y el modo por lotes (lote.py).
+"""
+import numpy as np
+import requests
+from geopy.distance import geodesic
+from metricas import incr, timed
+from optimizador_tour import distance_matrix_km, duration_matrix_min, solve_tour
+from rutas import get_client, get_route, get_routes
+
+# Número de estaciones candidatas en origen y en destino que se comparan (k x k pares)
+CANDIDATOS_K = 5
+# Estimaciones cuando no hay matriz ni respuesta de OSRM: distancia en línea recta x rodeo / velocidad
+FACTOR_RODEO, VELOCIDAD_PIE_KMH, VELOCIDAD_BICI_KMH = 1.3, 5.0, 15.0
+
+@timed("find_closest_station")
+def find_closest_station(target_coords, station_index, min_required=1, criteria_col="bicis_disponibles", counts=None):
+    # `counts`: contadores previstos a la hora de llegada (forecast_counts) en lugar de los de la foto
+    if not target_coords or station_index.empty: return None
+    return station_index.closest(target_coords, min_required, criteria_col, counts)
+
+def forecast_counts(station_index, start_coords, forecaster, criteria_col, speed_kmh):
+    """
+    Bicis o bornes previstos en cada estación a la hora a la que se llegaría desde `start_coords`
+    (en línea recta x rodeo a `speed_kmh`). None si no hay previsión disponible.
+    """
+    if forecaster is None or station_index.empty: return None
+    minutes = station_index.distances(start_coords) / 1000 * FACTOR_RODEO / speed_kmh * 60
+    return forecaster.forecast(station_index, criteria_col, minutes)
+
+def _estimate_min(from_coords, to_coords, speed_kmh):
+    a, b = np.asarray(from_coords, dtype=float).reshape(-1, 2), np.asarray(to_coords, dtype=float).reshape(-1, 2)
+    return distance_matrix_km(np.r_[a[:, 0], b[:, 0]], np.r_[a[:, 1], b[:, 1]])[:len(a), len(a):] * FACTOR_RODEO / speed_kmh * 60
+
+def _leg_durations(start_coords, end_coords, coords_o, coords_d, matrices=None, sites=(None, None), origenes=(), destinos=()):
+    """
+    Duraciones (min) de los tramos de todos los pares candidatos: pie hasta cada origen (k),
+    bici entre cada origen y destino (k x k) y pie desde cada destino (k). Se toman de las
+    matrices precalculadas cuando cubren el tramo; lo que falte se pide en una sola petición
+    `table` por perfil (en paralelo) y, si OSRM falla, se estima en línea recta.
+    """
+    walk1 = walk2 = bike = None
+    if matrices is not None:
+        o = [matrices.station(e.get('numero_estacion')) for e in origenes]; d = [matrices.station(e.get('numero_estacion')) for e in destinos]
+        if None not in o and None not in d:
+            bike = np.asarray(matrices.arrays['bici_estaciones'][0][np.ix_(o, d)], dtype=float)
+            site_a, site_b = matrices.site(sites[0]), matrices.site(sites[1])
+            if site_a is not None: walk1 = np.asarray(matrices.arrays['pie_sitios_estaciones'][0][site_a, o], dtype=float)
+            if site_b is not None: walk2 = np.asarray(matrices.arrays['pie_estaciones_sitios'][0][d, site_b], dtype=float)
+    pending, tables = {}, {}
+    client = get_client()
+    if walk1 is None or walk2 is None:
+        pending['foot'] = client.executor.submit(client.get_table, [start_coords] + coords_d, coords_o + [end_coords], 'foot')
+    if bike is None:
+        pending['bike'] = client.executor.submit(client.get_table, coords_o, coords_d, 'bike')
+    # Cada perfil por separado: si falla uno, el otro sigue usando su respuesta
+    for profile, future in pending.items():
+        try: tables[profile] = future.result()[0].astype(float)
+        except (requests.exceptions.RequestException, ValueError, KeyError): incr('external_errors', source='osrm_table')
+    if 'foot' in tables:
+        if walk1 is None: walk1 = tables['foot'][0, :len(coords_o)]
+        if walk2 is None: walk2 = tables['foot'][1:, -1]
+    if 'bike' in tables and bike is None: bike = tables['bike']
+    walk1 = _estimate_min(start_coords, coords_o, VELOCIDAD_PIE_KMH)[0] if walk1 is None else np.where(np.isnan(walk1), _estimate_min(start_coords, coords_o, VELOCIDAD_PIE_KMH)[0], walk1)
+    walk2 = _estimate_min(end_coords, coords_d, VELOCIDAD_PIE_KMH)[0] if walk2 is None else np.where(np.isnan(walk2), _estimate_min(end_coords, coords_d, VELOCIDAD_PIE_KMH)[0], walk2)
+    estimated_bike = _estimate_min(coords_o, coords_d, VELOCIDAD_BICI_KMH)
+    bike = estimated_bike if bike is None else np.where(np.isnan(bike), estimated_bike, bike)
+    return walk1, bike, walk2
+
+@timed("choose_station_pair")
+def choose_station_pair(start_coords, end_coords, station_index, min_bikes, min_docks, k=CANDIDATOS_K, matrices=None, sites=(None, None), counts=(None, None)):
+    """
+    Compara las k estaciones con bicis más cercanas al origen con las k con bornes más cercanas al
+    destino y devuelve los pares ordenados por tiempo total pie+bici+pie estimado, como una lista
+    de (estacion_origen, estacion_destino, minutos). Vacía si no hay estaciones que cumplan el mínimo.
+    """
+    pos_o, dist_o = station_index.nearest(start_coords, k, min_bikes, "bicis_disponibles", counts[0])
+    pos_d, dist_d = station_index.nearest(end_coords, k, min_docks, "bornes_libres", counts[1])
+    if pos_o.size == 0 or pos_d.size == 0: return []
+    origenes = [station_index.station(p, d) for p, d in zip(pos_o, dist_o)]
+    destinos = [station_index.station(p, d) for p, d in zip(pos_d, dist_d)]
+    if len(origenes) == 1 and len(destinos) == 1: return [(origenes[0], destinos[0], None)]
+    coords_o = list(zip(station_index.lats[pos_o], station_index.lons[pos_o])); coords_d = list(zip(station_index.lats[pos_d], station_index.lons[pos_d]))
+    walk1, bike, walk2 = _leg_durations(start_coords, end_coords, coords_o, coords_d, matrices, sites, origenes, destinos)
+    total = walk1[:, None] + bike + walk2[None, :]
+    # Coger y dejar la bici en la misma estación no es un viaje en bici
+    total[np.equal.outer(pos_o, pos_d)] = np.inf
+    order = np.argsort(total, axis=None, kind='stable')
+    return [(origenes[i], destinos[j], float(total[i, j])) for i, j in zip(*np.unravel_index(order, total.shape)) if np.isfinite(total[i, j])]
+
+@timed("get_trip_details")
+def get_trip_details(start_coords, end_coords, station_index, min_bikes, min_docks, k=CANDIDATOS_K, matrices=None, sites=(None, None), forecaster=None):
+    # Lógica de caminata para distancias cortas
+    if geodesic(start_coords, end_coords).meters < 500:
+        geom, dist, time = get_route(start_coords, end_coords, 'foot')
+        if not geom: return {'error': 'No se pudo calcular la ruta a pie.'}
+        return {'trip_type': 'walk', 'total_dist': dist, 'total_time': time, 'geoms': {'walk_only': geom}, 'error': None}
+
+    # Lógica normal de Valenbisi. Con histórico, los mínimos se exigen a la hora prevista de llegada
+    counts = (forecast_counts(station_index, start_coords, forecaster, "bicis_disponibles", VELOCIDAD_PIE_KMH), forecast_counts(station_index, start_coords, forecaster, "bornes_libres", VELOCIDAD_BICI_KMH))
+    pairs = choose_station_pair(start_coords, end_coords, station_index, min_bikes, min_docks, k, matrices, sites, counts)
+    if not pairs:
+        # Solo en el caso de error se averigua qué extremo se ha quedado sin estaciones
+        if not find_closest_station(start_coords, station_index, min_bikes, "bicis_disponibles", counts[0]): return {'error': 'No se encontró estación de origen con suficientes bicis.'}
+        if not find_closest_station(end_coords, station_index, min_docks, "bornes_libres", counts[1]): return {'error': 'No se encontró estación de destino con suficientes bornes.'}
+        return {'error': 'No se encontró una combinación de estaciones válida.'}
+    estacion_origen, estacion_destino, _ = pairs[0]
+    if counts[0] is not None:
+        estacion_origen = {**estacion_origen, 'bicis_previstas': float(counts[0][station_index.positions[str(estacion_origen['numero_estacion'])]])}
+        estacion_destino = {**estacion_destino, 'bornes_previstos': float(counts[1][station_index.positions[str(estacion_destino['numero_estacion'])]])}
+    coords_origen, coords_destino = (estacion_origen['latitude'], estacion_origen['longitude']), (estacion_destino['latitude'], estacion_destino['longitude'])
+    (geom_p1, dist_p1, time_p1), (geom_b, dist_b, time_b), (geom_p2, dist_p2, time_p2) = get_routes([(start_coords, coords_origen, 'foot'), (coords_origen, coords_destino, 'bike'), (coords_destino, end_coords, 'foot')])
+    if not all([geom_p1, geom_b, geom_p2]): return {'error': 'No se pudo calcular la ruta completa.'}
+    return {'trip_type': 'valenbisi', 'estacion_origen': estacion_origen, 'estacion_destino': estacion_destino, 'geoms': {'pie1': geom_p1, 'bici': geom_b, 'pie2': geom_p2}, 'dists': {'pie1': dist_p1, 'bici': dist_b, 'pie2': dist_p2}, 'times': {'pie1': time_p1, 'bici': time_b, 'pie2': time_p2}, 'total_time': time_p1 + time_b + time_p2, 'total_dist': dist_p1 + dist_b + dist_p2, 'co2_saved_kg': (dist_b * 135) / 1000, 'alternativas': [{'estacion_origen': o, 'estacion_destino': d, 'tiempo_estimado': t} for o, d, t in pairs[1:4]], 'error': None}
+
+@timed("get_optimal_route_order")
+def get_optimal_route_order(points_df, matrices=None, station_index=None):
+    """Ordena las paradas (la primera fila es el punto de partida). Usa duraciones reales si hay matrices."""
+    if matrices is not None and station_index is not None: cost = duration_matrix_min(points_df, matrices, station_index)
+    else: cost = distance_matrix_km(points_df['latitude'], points_df['longitude'])
+    return points_df.iloc[solve_tour(cost)].copy().reset_index(drop=True)
+
+def estimate_stage(site_a, site_b, coords_a, coords_b, station_index, matrices, min_bikes=1):
+    # Estimación sin llamadas de red a partir de las matrices precalculadas
+    if matrices is None: return None
+    if geodesic(coords_a, coords_b).meters < 500:
+        walk = matrices.walk(site_a, site_b)
+        return {'total_dist': walk[0], 'total_time': walk[1]} if walk else None
+    estacion_origen = find_closest_station(coords_a, station_index, min_bikes, "bicis_disponibles")
+    estacion_destino = find_closest_station(coords_b, station_index, min_bikes, "bornes_libres")
+    if not estacion_origen or not estacion_destino: return None
+    return matrices.estimate_trip(site_a, site_b, estacion_origen, estacion_destino)
+
+def calculate_calories(distance_km, duration_min):
+    if duration_min == 0: return 0
+    speed_kmh = distance_km / (duration_min / 60)
+    min_speed, max_speed = 15, 28
+    min_kcal_hr, max_kcal_hr = 400, 900
+    clamped_speed = max(min_speed, min(speed_kmh, max_speed))
+    kcal_per_hour = min_kcal_hr + (clamped_speed - min_speed) * (max_kcal_hr - min_kcal_hr) / (max_speed - min_speed)
+    return kcal_per_hour * (duration_min / 60)
+
+def trip_summary(trip):
+    """Versión compacta de un viaje (sin geometrías) para respuestas de la API y resultados por lotes."""
+    if trip.get('error'): return {'error': trip['error']}
+    summary = {'trip_type': trip['trip_type'], 'total_time': trip['total_time'], 'total_dist': trip['total_dist'], 'error': None}
+    if trip['trip_type'] == 'valenbisi':
+        summary.update({'estacion_origen': trip['estacion_origen'].get('nombre_estacion'), 'estacion_destino': trip['estacion_destino'].get('nombre_estacion'), 'co2_saved_kg': trip['co2_saved_kg'], 'calorias': calculate_calories(trip['dists']['bici'], trip['times']['bici'])})
+    return summary
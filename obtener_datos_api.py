@@ -1,80 +1,173 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import requests
 import pandas as pd
-import time
 
-def generar_csv_bruto_desde_api(output_filename="recursos_turisticos_api_bruto.csv"):
+API_URL = "https://valencia.opendatasoft.com/api/records/1.0/search/"
+DATASET = "recursos-turisticos"
+FILAS_POR_PAGINA = 100  # Máximo de registros por página
+
+class LimitadorPeticiones:
+    """Limita el número de peticiones por segundo que se lanzan entre todos los hilos."""
+    def __init__(self, peticiones_por_segundo):
+        self.intervalo = 1.0 / peticiones_por_segundo if peticiones_por_segundo else 0
+        self.lock = threading.Lock()
+        self.siguiente = time.monotonic()
+
+    def esperar(self):
+        with self.lock:
+            ahora = time.monotonic()
+            espera = max(0.0, self.siguiente - ahora)
+            self.siguiente = max(ahora, self.siguiente) + self.intervalo
+        if espera: time.sleep(espera)
+
+def pedir_pagina(session, api_url, start, limitador, desde=None):
+    params = {"dataset": DATASET, "rows": FILAS_POR_PAGINA, "start": start, "sort": "-objectid"}
+    if desde: params["q"] = f'last_edited_date>="{desde}"'
+    limitador.esperar()
+    res = session.get(api_url, params=params, timeout=20)
+    res.raise_for_status()
+    return res.json()
+
+def registro_a_fila(record):
+    # Extraemos el diccionario 'fields' completo de cada registro
+    fila = dict(record['fields'])
+    fila.setdefault('recordid', record.get('recordid'))
+    return fila
+
+def cargar_checkpoint(path, desde):
+    try:
+        with open(path, encoding='utf-8') as f: estado = json.load(f)
+    except (OSError, ValueError):
+        return None
+    # Un checkpoint de otra consulta (otro filtro incremental) no sirve para reanudar
+    return estado if estado.get('desde') == desde else None
+
+def guardar_checkpoint(path, estado):
+    tmp = f"{path}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f: json.dump(estado, f)
+    os.replace(tmp, path)
+
+def punto_geo(valor):
+    """[lat, lon] de un `geo_point_2d` en cualquiera de sus formas: lista, texto "[lat, lon]" o {"lat", "lon"}."""
+    if isinstance(valor, str):
+        try: valor = json.loads(valor)
+        except ValueError: return [None, None]
+    if isinstance(valor, dict): valor = [valor.get('lat'), valor.get('lon')]
+    return list(valor) if isinstance(valor, (list, tuple)) and len(valor) == 2 else [None, None]
+
+def tipar_recursos(df):
+    """Convierte los campos de la API en columnas tipadas para guardarlas en Parquet."""
+    df = df.copy()
+    for col in ['last_edited_date', 'created_date']:
+        if col in df.columns: df[col] = pd.to_datetime(df[col], errors='coerce', utc=True)
+    if 'objectid' in df.columns: df['objectid'] = pd.to_numeric(df['objectid'], errors='coerce').astype('Int64')
+    if 'geo_point_2d' in df.columns:
+        puntos = df['geo_point_2d'].apply(punto_geo)
+        df['latitude'] = pd.to_numeric(puntos.str[0], errors='coerce')
+        df['longitude'] = pd.to_numeric(puntos.str[1], errors='coerce')
+        # Se conserva el mismo formato de texto que el CSV para que los lectores existentes sigan funcionando
+        df['geo_point_2d'] = puntos.apply(lambda p: f"[{p[0]}, {p[1]}]" if p[0] is not None else None)
+    for col in df.columns:
+        if df[col].dtype == object: df[col] = df[col].apply(lambda v: json.dumps(v, ensure_ascii=False) if isinstance(v, (dict, list)) else v).astype('string')
+    return df
+
+def ultima_edicion(parquet_path):
+    if not os.path.exists(parquet_path): return None
+    fechas = pd.read_parquet(parquet_path, columns=['last_edited_date'])['last_edited_date'].dropna()
+    return fechas.max().strftime('%Y-%m-%dT%H:%M:%S') if not fechas.empty else None
+
+def generar_datos_desde_api(output_parquet="recursos_turisticos_api.parquet", output_csv=None, incremental=False, max_workers=4, peticiones_por_segundo=5, api_url=API_URL):
     """
-    Obtiene TODOS los datos de los recursos turísticos desde la API
-    y los guarda en un archivo CSV sin ningún tipo de procesamiento o limpieza.
+    Descarga los recursos turísticos de la API pidiendo varias páginas en paralelo (con un
+    límite de peticiones por segundo). Cada página se escribe en disco en cuanto llega y se
+    guarda un checkpoint con las páginas completadas, así que si la ejecución falla se puede
+    relanzar y continúa donde se quedó. Con `incremental=True` solo se piden los registros
+    editados después del último `last_edited_date` del Parquet existente.
     """
-    print("Iniciando la extracción de todos los recursos desde la API (modo bruto)...")
-    url = "https://valencia.opendatasoft.com/api/records/1.0/search/"
-    params = {
-        "dataset": "recursos-turisticos",
-        "rows": 100,  # Máximo de registros por página
-        "start": 0
-    }
-    
-    all_records_fields = []
-    total_recursos = 0
-
-    while True:
-        try:
-            res = requests.get(url, params=params, timeout=20)
-            res.raise_for_status()
-            data = res.json()
-            
-            records = data.get('records', [])
-            if not records:
-                break
-            
-            # Extraemos el diccionario 'fields' completo de cada registro
-            for record in records:
-                if 'fields' in record:
-                    all_records_fields.append(record['fields'])
-            
-            # Preparamos la siguiente petición
-            total_obtenidos = len(all_records_fields)
-            if 'nhits' in data:
-                total_recursos = data['nhits']
-
-            params['start'] += len(records)
-            
-            print(f"  ... Obtenidos {total_obtenidos} de {total_recursos} recursos.", end='\r')
-            
-            if total_obtenidos >= total_recursos:
-                break
-                
-            time.sleep(0.1)
-
-        except requests.exceptions.RequestException as e:
-            print(f"\n❌ Error al conectar con la API: {e}")
-            return False
-        except KeyError as e:
-            print(f"\n❌ Error: La respuesta de la API no tiene el formato esperado. Faltó la clave: {e}")
-            return False
-
-    print(f"\n\nExtracción finalizada. Se encontraron {len(all_records_fields)} recursos turísticos.")
-    
-    if not all_records_fields:
-        print("No se extrajo ningún dato, no se generará el archivo CSV.")
+    desde = ultima_edicion(output_parquet) if incremental else None
+    parcial, checkpoint = f"{output_parquet}.parcial.jsonl", f"{output_parquet}.checkpoint.json"
+    estado = cargar_checkpoint(checkpoint, desde)
+    if estado is None:
+        estado = {'desde': desde, 'nhits': None, 'paginas': []}
+        if os.path.exists(parcial): os.remove(parcial)
+    else:
+        print(f"Reanudando la extracción: {len(estado['paginas'])} páginas ya descargadas.")
+    print("Iniciando la extracción de los recursos desde la API" + (f" (editados desde {desde})..." if desde else "..."))
+
+    session, limitador, lock = requests.Session(), LimitadorPeticiones(peticiones_por_segundo), threading.Lock()
+    completadas = set(estado['paginas'])
+
+    def guardar_pagina(start, data):
+        filas = [registro_a_fila(r) for r in data.get('records', []) if 'fields' in r]
+        with lock:
+            with open(parcial, 'a', encoding='utf-8') as f:
+                for fila in filas: f.write(json.dumps(fila, ensure_ascii=False) + "\n")
+            completadas.add(start); estado['paginas'] = sorted(completadas)
+            guardar_checkpoint(checkpoint, estado)
+            print(f"  ... Descargadas {len(completadas)} páginas de {-(-estado['nhits'] // FILAS_POR_PAGINA)}.", end='\r')
+
+    try:
+        if estado['nhits'] is None or 0 not in completadas:
+            primera = pedir_pagina(session, api_url, 0, limitador, desde)
+            estado['nhits'] = primera.get('nhits', 0)
+            guardar_pagina(0, primera)
+        pendientes = [s for s in range(FILAS_POR_PAGINA, estado['nhits'], FILAS_POR_PAGINA) if s not in completadas]
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futuros = {executor.submit(pedir_pagina, session, api_url, s, limitador, desde): s for s in pendientes}
+            # Las páginas que sí llegaron se guardan aunque otra falle, para no volver a pedirlas al reanudar
+            errores = []
+            for futuro in as_completed(futuros):
+                try: guardar_pagina(futuros[futuro], futuro.result())
+                except requests.exceptions.RequestException as e: errores.append(e)
+            if errores: raise errores[0]
+    except requests.exceptions.RequestException as e:
+        print(f"\n❌ Error al conectar con la API: {e}\n   Vuelve a ejecutar el script para continuar desde el último checkpoint.")
+        return False
+    except (KeyError, ValueError) as e:
+        print(f"\n❌ Error: La respuesta de la API no tiene el formato esperado: {e}")
         return False
-        
-    # Crear un DataFrame de pandas directamente desde la lista de diccionarios
-    df = pd.DataFrame(all_records_fields)
-    
+
+    filas = []
+    if os.path.exists(parcial):
+        with open(parcial, encoding='utf-8') as f: filas = [json.loads(linea) for linea in f if linea.strip()]
+    print(f"\n\nExtracción finalizada. Se obtuvieron {len(filas)} recursos turísticos.")
+    if not filas and not desde:
+        print("No se extrajo ningún dato, no se generará el archivo.")
+        return False
+
+    df = tipar_recursos(pd.DataFrame(filas)) if filas else pd.DataFrame()
+    if desde and os.path.exists(output_parquet):
+        # Los registros editados sustituyen a su versión anterior
+        df = pd.concat([pd.read_parquet(output_parquet), df], ignore_index=True)
+    clave = 'globalid' if 'globalid' in df.columns else 'recordid'
+    if clave in df.columns: df = df.drop_duplicates(subset=[clave], keep='last').reset_index(drop=True)
     print(f"Columnas obtenidas de la API: {list(df.columns)}")
 
     try:
-        # Guardar el DataFrame en un archivo CSV sin modificar nada
+        df.to_parquet(output_parquet, index=False)
         # 'utf-8-sig' es importante para que Excel y otros programas abran bien los acentos.
-        df.to_csv(output_filename, index=False, encoding='utf-8-sig')
-        print(f"✅ ¡Éxito! Se han guardado {len(df)} recursos con todos sus campos en '{output_filename}'.")
-        return True
+        if output_csv: df.to_csv(output_csv, index=False, encoding='utf-8-sig')
     except Exception as e:
-        print(f"\n❌ Error al guardar el archivo CSV: {e}")
+        print(f"\n❌ Error al guardar los archivos: {e}")
         return False
+    for path in (parcial, checkpoint):
+        if os.path.exists(path): os.remove(path)
+    print(f"✅ ¡Éxito! Se han guardado {len(df)} recursos en '{output_parquet}'" + (f" y '{output_csv}'." if output_csv else "."))
+    return True
+
+def generar_csv_bruto_desde_api(output_filename="recursos_turisticos_api_bruto.csv"):
+    """
+    Obtiene TODOS los datos de los recursos turísticos desde la API y los guarda en un CSV
+    (además del Parquet). Los campos se guardan tal cual salvo `geo_point_2d`, que se normaliza
+    a "[lat, lon]" con las columnas `latitude`/`longitude` añadidas, `recordid` y los campos
+    anidados, que se guardan como JSON.
+    """
+    return generar_datos_desde_api(output_parquet=os.path.splitext(output_filename)[0] + ".parquet", output_csv=output_filename)
 
 # --- Ejecución del script ---
 if __name__ == "__main__":
-    generar_csv_bruto_desde_api()
\ No newline at end of file
+    generar_datos_desde_api(output_csv="recursos_turisticos_api_bruto.csv", incremental=True)
@@ -0,0 +1,107 @@
+import time
+import numpy as np
+from indice_estaciones import haversine_m
+
+# Presupuesto de tiempo por defecto para la mejora local (segundos).
+TIME_BUDGET_S = 0.25
+# Velocidad media pie+bici para convertir km en minutos cuando una parada no está en las matrices.
+VELOCIDAD_MEDIA_KMH = 12.0
+
+def distance_matrix_km(lats, lons):
+    lats, lons = np.asarray(lats, dtype=float), np.asarray(lons, dtype=float)
+    return haversine_m(lats[:, None], lons[:, None], lats[None, :], lons[None, :]) / 1000
+
+def duration_matrix_min(stops_df, matrices, station_index, min_bikes=1):
+    """
+    Matriz de duraciones (min) entre paradas usando tramos reales pie+bici+pie de las matrices
+    precalculadas, o el paseo directo si es más corto. Las paradas que no son puntos de interés
+    conocidos (p. ej. el punto de partida) se estiman con la distancia en línea recta.
+    """
+    lats, lons = stops_df['latitude'].to_numpy(dtype=float), stops_df['longitude'].to_numpy(dtype=float)
+    cost = distance_matrix_km(lats, lons) / VELOCIDAD_MEDIA_KMH * 60
+    sites = np.array([matrices.site(n) if matrices.site(n) is not None else -1 for n in stops_df['nombre_centro']])
+    origen, destino = np.full(len(sites), -1), np.full(len(sites), -1)
+    for k, (lat, lon) in enumerate(zip(lats, lons)):
+        if sites[k] < 0: continue
+        o = station_index.closest((lat, lon), min_bikes, "bicis_disponibles"); d = station_index.closest((lat, lon), min_bikes, "bornes_libres")
+        origen[k] = matrices.station(o.get('numero_estacion')) if o and matrices.station(o.get('numero_estacion')) is not None else -1
+        destino[k] = matrices.station(d.get('numero_estacion')) if d and matrices.station(d.get('numero_estacion')) is not None else -1
+    conocidas = np.flatnonzero((sites >= 0) & (origen >= 0) & (destino >= 0))
+    if conocidas.size:
+        s, o, d = sites[conocidas], origen[conocidas], destino[conocidas]
+        bike = matrices.arrays['pie_sitios_estaciones'][0][s, o][:, None] + matrices.arrays['bici_estaciones'][0][np.ix_(o, d)] + matrices.arrays['pie_estaciones_sitios'][0][d, s][None, :]
+        walk = matrices.arrays['pie_sitios'][0][np.ix_(s, s)]
+        real = np.fmin(bike, walk)
+        block = cost[np.ix_(conocidas, conocidas)]
+        cost[np.ix_(conocidas, conocidas)] = np.where(np.isnan(real), block, real)
+    np.fill_diagonal(cost, 0)
+    return cost
+
+def path_cost(path, cost):
+    path = np.asarray(path)
+    return float(cost[path[:-1], path[1:]].sum())
+
+def nearest_neighbour(cost, start=0):
+    n = len(cost); path = [start]
+    visited = np.zeros(n, dtype=bool); visited[start] = True
+    for _ in range(n - 1):
+        row = np.where(visited, np.inf, cost[path[-1]])
+        nxt = int(np.argmin(row)); path.append(nxt); visited[nxt] = True
+    return np.array(path)
+
+def two_opt(path, cost, deadline):
+    """2-opt sobre un camino abierto con el primer nodo fijo. Evalúa todos los j de cada i de forma vectorizada."""
+    path, n = path.copy(), len(path)
+    symmetric = np.allclose(cost, cost.T)
+    improved = True
+    while improved and time.perf_counter() < deadline:
+        improved = False
+        for i in range(1, n - 1):
+            a, b = path[i - 1], path[i]
+            js = np.arange(i + 1, n)
+            c, d = path[js], path[np.minimum(js + 1, n - 1)]
+            has_next = js < n - 1
+            old = cost[a, b] + np.where(has_next, cost[c, d], 0)
+            new = cost[a, c] + np.where(has_next, cost[b, d], 0)
+            if not symmetric:
+                # En matrices asimétricas invertir el tramo cambia también su coste interno
+                new = new + np.cumsum(cost[path[i + 1:], path[i:-1]]) - np.cumsum(cost[path[i:-1], path[i + 1:]])
+            delta = new - old
+            j = int(np.argmin(delta))
+            if delta[j] < -1e-9:
+                path[i:js[j] + 1] = path[i:js[j] + 1][::-1]; improved = True
+            if time.perf_counter() >= deadline: break
+    return path
+
+def or_opt(path, cost, deadline, max_segment=3):
+    """Mueve segmentos de 1 a `max_segment` paradas a la mejor posición del camino mientras haya mejora."""
+    path, n = path.copy(), len(path)
+    improved = True
+    while improved and time.perf_counter() < deadline:
+        improved = False
+        for seg_len in range(1, max_segment + 1):
+            for i in range(1, n - seg_len + 1):
+                first, last, prev = path[i], path[i + seg_len - 1], path[i - 1]
+                nxt = path[i + seg_len] if i + seg_len < n else None
+                removal = (cost[prev, nxt] - cost[prev, first] - cost[last, nxt]) if nxt is not None else -cost[prev, first]
+                rest = np.concatenate([path[:i], path[i + seg_len:]])
+                u, v = rest, np.append(rest[1:], -1)
+                insertion = cost[u, first] + np.where(v >= 0, cost[last, np.maximum(v, 0)] - cost[u, np.maximum(v, 0)], 0)
+                insertion[i - 1] = np.inf  # posición original
+                k = int(np.argmin(insertion))
+                if removal + insertion[k] < -1e-9:
+                    path = np.concatenate([rest[:k + 1], path[i:i + seg_len], rest[k + 1:]]); improved = True
+                if time.perf_counter() >= deadline: return path
+    return path
+
+def solve_tour(cost, start=0, time_budget=TIME_BUDGET_S):
+    """Orden de visita que empieza en `start`: vecino más cercano y después 2-opt y Or-opt hasta agotar el presupuesto."""
+    cost = np.asarray(cost, dtype=float)
+    if len(cost) <= 2: return np.arange(len(cost))
+    deadline = time.perf_counter() + time_budget
+    path = nearest_neighbour(cost, start)
+    while time.perf_counter() < deadline:
+        previous = path_cost(path, cost)
+        path = or_opt(two_opt(path, cost, deadline), cost, deadline)
+        if path_cost(path, cost) >= previous - 1e-9: break
+    return path
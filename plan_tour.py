@@ -0,0 +1,101 @@
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
+
+_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="tour")
+# Resultados memorizados por tour: (etapa, mínimo de bicis/bornes) distintos que se conservan
+MAX_PLANES = 32
+# Tours distintos (punto de partida, paradas) cuyos planes se comparten entre sesiones
+MAX_TOURS = 256
+
+def still_valid(trip, station_index, min_bikes, min_docks):
+    """
+    Comprueba una etapa ya calculada contra la disponibilidad actual. Devuelve la etapa con
+    los contadores de las estaciones actualizados, o None si alguna ya no cumple el mínimo.
+    """
+    if trip.get('error'): return None
+    if trip['trip_type'] == 'walk': return trip
+    origen = station_index.find(trip['estacion_origen'].get('numero_estacion'))
+    destino = station_index.find(trip['estacion_destino'].get('numero_estacion'))
+    if not origen or not destino or origen['bicis_disponibles'] < min_bikes or destino['bornes_libres'] < min_docks: return None
+    return {**trip, 'estacion_origen': {**trip['estacion_origen'], **origen}, 'estacion_destino': {**trip['estacion_destino'], **destino}}
+
+class TourPlan:
+    """
+    Plan de las etapas de un tour. Al empezar se calculan todas las etapas en segundo plano
+    y cada resultado se memoriza por (etapa, mínimo de bicis/bornes, foto de disponibilidad).
+    Cuando el usuario llega a una etapa calculada con una foto anterior, solo se revalida
+    contra los contadores actuales; se vuelve a planificar si las estaciones ya no sirven.
+    Solo se conserva el último resultado de cada (etapa, mínimo), hasta `max_plans` en total.
+    Las etapas con error no se memorizan: la siguiente consulta las vuelve a planificar.
+    """
+    def __init__(self, stops, plan_fn, executor=_executor, names=None, max_plans=MAX_PLANES):
+        self.stops = list(stops)
+        # Con los nombres de las paradas el planificador puede usar las matrices precalculadas
+        self.names = list(names) if names is not None else None
+        self.plan_fn, self.executor, self.max_plans = plan_fn, executor, max_plans
+        # Reentrante: el callback de un futuro que ya ha terminado se ejecuta dentro de _store
+        self.lock = threading.RLock()
+        self.futures = {}
+        self.latest = OrderedDict()
+
+    @property
+    def num_stages(self): return len(self.stops) - 1
+
+    def _call(self, stage, min_bikes, snapshot):
+        kwargs = {'sites': (self.names[stage], self.names[stage + 1])} if self.names else {}
+        return self.plan_fn(self.stops[stage], self.stops[stage + 1], snapshot.index, min_bikes, min_bikes, **kwargs)
+
+    def _store(self, key, future):
+        # Llamar con self.lock. La nueva entrada sustituye a la anterior de la misma (etapa, mínimo)
+        self.futures[key] = future
+        self.latest[key[:2]] = key; self.latest.move_to_end(key[:2])
+        while len(self.latest) > self.max_plans: self.latest.popitem(last=False)
+        vigentes = set(self.latest.values())
+        for k in [k for k in self.futures if k not in vigentes]: del self.futures[k]
+        future.add_done_callback(partial(self._forget_failed, key))
+
+    def _forget_failed(self, key, future):
+        # Un fallo puntual (de OSRM, por ejemplo) no se sirve en las siguientes ejecuciones ni a otras sesiones
+        if not future.cancelled() and future.exception() is None and not future.result().get('error'): return
+        with self.lock:
+            if self.futures.get(key) is not future: return
+            del self.futures[key]
+            if self.latest.get(key[:2]) == key: del self.latest[key[:2]]
+
+    def submit(self, stage, min_bikes, snapshot):
+        key = (stage, min_bikes, snapshot.fetched_at)
+        with self.lock:
+            future = self.futures.get(key)
+            if future is None:
+                future = self.executor.submit(self._call, stage, min_bikes, snapshot); self._store(key, future)
+            return future
+
+    def prefetch(self, snapshot, min_bikes=1, first_stage=0):
+        for stage in range(first_stage, self.num_stages): self.submit(stage, min_bikes, snapshot)
+
+    def get(self, stage, min_bikes, snapshot):
+        key = (stage, min_bikes, snapshot.fetched_at)
+        with self.lock:
+            future = self.futures.get(key)
+            previous = self.futures.get(self.latest.get((stage, min_bikes)))
+            # Lo que el usuario espera no se pone a la cola detrás de los prefetch de otras sesiones:
+            # si aún no ha empezado en el pool se calcula aquí mismo
+            inline = future is None or future.cancel()
+            if inline:
+                future = Future(); future.set_running_or_notify_cancel()
+                if previous is None or previous.cancelled(): previous = None
+                self._store(key, future)
+        if inline:
+            trip = still_valid(previous.result(), snapshot.index, min_bikes, min_bikes) if previous is not None and previous.done() and not previous.exception() else None
+            if trip is not None:
+                future.set_result(trip); return trip
+            try: trip = self._call(stage, min_bikes, snapshot)
+            except Exception as e: future.set_exception(e); raise
+            future.set_result(trip)
+        else:
+            trip = future.result()
+        # Las siguientes etapas se preparan con el mismo mínimo mientras el usuario pedalea
+        self.prefetch(snapshot, min_bikes, stage + 1)
+        return trip
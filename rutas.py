@@ -0,0 +1,151 @@
+import json
+import os
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+from metricas import incr, span
+
+OSRM_BASE_URL = os.getenv("OSRM_BASE_URL", "http://router.project-osrm.org")
+ROUTE_CACHE_PATH = os.getenv("ROUTE_CACHE_PATH", os.path.join(".cache", "rutas.sqlite"))
+# Las coordenadas se ajustan a una rejilla de 1e-4 grados (~10 m) antes de pedir la ruta,
+# así dos peticiones casi idénticas comparten entrada en la caché.
+GRID_DECIMALS = 4
+
+def snap(coords):
+    return (round(float(coords[0]), GRID_DECIMALS), round(float(coords[1]), GRID_DECIMALS))
+
+class RouteCache:
+    """Caché persistente de rutas OSRM en SQLite, compartida entre hilos y reinicios de la app."""
+    def __init__(self, path=ROUTE_CACHE_PATH):
+        if path != ":memory:" and os.path.dirname(path): os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS rutas (clave TEXT PRIMARY KEY, geometria TEXT, distancia_km REAL, duracion_min REAL)")
+        # Tramos del servicio `table`: solo distancia y duración, sin geometría
+        self.conn.execute("CREATE TABLE IF NOT EXISTS tramos (clave TEXT PRIMARY KEY, distancia_km REAL, duracion_min REAL)")
+        self.conn.commit()
+
+    @staticmethod
+    def key(start, end, profile):
+        return f"{profile}:{start[0]:.{GRID_DECIMALS}f},{start[1]:.{GRID_DECIMALS}f};{end[0]:.{GRID_DECIMALS}f},{end[1]:.{GRID_DECIMALS}f}"
+
+    def get(self, key):
+        with self.lock:
+            row = self.conn.execute("SELECT geometria, distancia_km, duracion_min FROM rutas WHERE clave = ?", (key,)).fetchone()
+        return (json.loads(row[0]), row[1], row[2]) if row else None
+
+    def put(self, key, route):
+        geom, dist, time = route
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO rutas VALUES (?, ?, ?, ?)", (key, json.dumps(geom), dist, time))
+            self.conn.commit()
+
+    def get_legs(self, keys, batch=500):
+        """Distancia y duración de los tramos conocidos, de `tramos` o de las rutas completas: {clave: (km, min)}."""
+        found = {}
+        with self.lock:
+            for i in range(0, len(keys), batch):
+                chunk = keys[i:i + batch]; marks = ",".join("?" * len(chunk))
+                rows = self.conn.execute(f"SELECT clave, distancia_km, duracion_min FROM rutas WHERE clave IN ({marks}) UNION ALL SELECT clave, distancia_km, duracion_min FROM tramos WHERE clave IN ({marks})", chunk + chunk)
+                found.update((key, (dist, time)) for key, dist, time in rows)
+        return found
+
+    def put_legs(self, legs):
+        with self.lock:
+            self.conn.executemany("INSERT OR REPLACE INTO tramos VALUES (?, ?, ?)", ((key, dist, time) for key, (dist, time) in legs.items()))
+            self.conn.commit()
+
+class RouteClient:
+    """
+    Cliente OSRM con sesión HTTP reutilizable, caché en disco y cálculo concurrente de tramos.
+    Las rutas fallidas no se guardan en caché.
+    """
+    def __init__(self, base_url=OSRM_BASE_URL, cache=None, timeout=12, max_workers=4):
+        self.base_url = base_url.rstrip('/')
+        self.cache = cache if cache is not None else RouteCache()
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.mount("http://", HTTPAdapter(pool_connections=2, pool_maxsize=max_workers))
+        self.session.mount("https://", HTTPAdapter(pool_connections=2, pool_maxsize=max_workers))
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="osrm")
+
+    def get_route(self, start_coords, end_coords, profile='bike'):
+        if not start_coords or not end_coords: return None, 0, 0
+        start, end = snap(start_coords), snap(end_coords)
+        key = RouteCache.key(start, end, profile)
+        cached = self.cache.get(key)
+        incr('cache', kind='rutas', result='hit' if cached else 'miss')
+        if cached: return cached
+        url = f"{self.base_url}/route/v1/{profile}/{start[1]},{start[0]};{end[1]},{end[0]}?overview=full&geometries=geojson"
+        try:
+            with span('osrm_route'):
+                res = self.session.get(url, timeout=self.timeout); res.raise_for_status()
+            incr('bytes_received', len(res.content), source='osrm')
+            route = (res.json().get('routes') or [{}])[0]
+        except (requests.exceptions.RequestException, ValueError):
+            incr('external_errors', source='osrm'); return None, 0, 0
+        result = (route.get('geometry'), route.get('distance', 0) / 1000, route.get('duration', 0) / 60)
+        if result[0]: self.cache.put(key, result)
+        return result
+
+    def get_routes(self, legs):
+        """Calcula en paralelo una lista de tramos `(start_coords, end_coords, profile)` y devuelve los resultados en orden."""
+        return list(self.executor.map(lambda leg: self.get_route(*leg), legs))
+
+    def get_table(self, sources, destinations, profile='foot', chunk=50, use_cache=True):
+        """
+        Duraciones (min) y distancias (km) del servicio `table` de OSRM entre cada origen y cada destino.
+        Se pide por bloques de `chunk` x `chunk` para respetar el límite de coordenadas del servidor;
+        los pares sin ruta quedan como NaN. Con `use_cache` los tramos ya conocidos se leen de la caché
+        y solo se piden las filas y columnas con algún par pendiente. Los errores de red se propagan al llamante.
+        """
+        sources, destinations = [snap(c) for c in sources], [snap(c) for c in destinations]
+        durations = np.full((len(sources), len(destinations)), np.nan, dtype=np.float32)
+        distances = np.full((len(sources), len(destinations)), np.nan, dtype=np.float32)
+        for i in range(0, len(sources), chunk):
+            for j in range(0, len(destinations), chunk):
+                src, dst = sources[i:i + chunk], destinations[j:j + chunk]
+                rows, cols = np.arange(len(src)), np.arange(len(dst))
+                if use_cache:
+                    keys = [[RouteCache.key(a, b, profile) for b in dst] for a in src]
+                    known = self.cache.get_legs([key for fila in keys for key in fila])
+                    missing = np.array([[key not in known for key in fila] for fila in keys])
+                    incr('cache', int(missing.size - missing.sum()), kind='tramos', result='hit'); incr('cache', int(missing.sum()), kind='tramos', result='miss')
+                    for a, fila in enumerate(keys):
+                        for b, key in enumerate(fila):
+                            if key in known: distances[i + a, j + b], durations[i + a, j + b] = known[key]
+                    rows, cols = np.flatnonzero(missing.any(axis=1)), np.flatnonzero(missing.any(axis=0))
+                    if rows.size == 0: continue
+                sub_src, sub_dst = [src[r] for r in rows], [dst[c] for c in cols]
+                coords = ";".join(f"{lon},{lat}" for lat, lon in sub_src + sub_dst)
+                idx_src, idx_dst = ";".join(str(k) for k in range(len(sub_src))), ";".join(str(len(sub_src) + k) for k in range(len(sub_dst)))
+                url = f"{self.base_url}/table/v1/{profile}/{coords}?sources={idx_src}&destinations={idx_dst}&annotations=duration,distance"
+                with span('osrm_table'):
+                    res = self.session.get(url, timeout=self.timeout * 5); res.raise_for_status()
+                incr('bytes_received', len(res.content), source='osrm')
+                data = res.json()
+                block_min = np.array(data['durations'], dtype=float) / 60; block_km = np.array(data['distances'], dtype=float) / 1000
+                durations[np.ix_(i + rows, j + cols)], distances[np.ix_(i + rows, j + cols)] = block_min, block_km
+                if use_cache:
+                    # Como en las rutas, los pares sin respuesta no se guardan
+                    self.cache.put_legs({RouteCache.key(sub_src[a], sub_dst[b], profile): (float(block_km[a, b]), float(block_min[a, b]))
+                                         for a, b in zip(*np.nonzero(np.isfinite(block_min) & np.isfinite(block_km)))})
+        return durations, distances
+
+_default_client = None
+_default_lock = threading.Lock()
+
+def get_client():
+    global _default_client
+    with _default_lock:
+        if _default_client is None: _default_client = RouteClient()
+    return _default_client
+
+def get_route(start_coords, end_coords, profile='bike'):
+    return get_client().get_route(start_coords, end_coords, profile)
+
+def get_routes(legs):
+    return get_client().get_routes(legs)
@@ -0,0 +1,108 @@
+"""
+Tabla compacta e inmutable de puntos de interés, compartida por todas las sesiones.
+
+Las coordenadas se guardan como un array (n, 2) en `SITIOS_DIR` y cada proceso (la app, la
+API, los procesos de lote.py) lo abre con memory-map de solo lectura, así que el sistema
+operativo mantiene una única copia en memoria. Las sesiones guardan solo índices de esta tabla.
+"""
+import json
+import os
+import numpy as np
+from datos import load_centros
+
+SITIOS_DIR = os.getenv("SITIOS_DIR", os.path.join(".cache", "sitios"))
+NOMBRE_PARTIDA = 'PUNTO DE PARTIDA'
+
+class Stop:
+    """Parada de un tour: un punto de interés (`index` >= 0) o el punto de partida (`index` == -1)."""
+    __slots__ = ('index', 'nombre_centro', 'latitude', 'longitude', 'info_url')
+
+    def __init__(self, index, nombre_centro, latitude, longitude, info_url=None):
+        self.index, self.nombre_centro, self.info_url = index, nombre_centro, info_url
+        self.latitude, self.longitude = float(latitude), float(longitude)
+
+    @property
+    def coords(self): return (self.latitude, self.longitude)
+
+    def __repr__(self): return f"Stop({self.index}, {self.nombre_centro!r})"
+
+class SiteTable:
+    """
+    Puntos de interés como struct-of-arrays: nombres y URLs en tuplas y coordenadas en un array
+    de solo lectura. Los objetos Stop se crean una vez y se reutilizan en todas las sesiones.
+    """
+    def __init__(self, names, coords, info_urls):
+        self.names, self.info_urls = tuple(names), tuple(info_urls)
+        self.coords = coords if isinstance(coords, np.memmap) else np.array(coords, dtype=np.float64).reshape(-1, 2)
+        self.coords.setflags(write=False)
+        self.lats, self.lons = self.coords[:, 0], self.coords[:, 1]
+        self.positions = {name: i for i, name in enumerate(self.names)}
+        self.sorted_names = tuple(sorted(self.positions))
+        self.stops = tuple(Stop(i, n, lat, lon, url) for i, (n, (lat, lon), url) in enumerate(zip(self.names, self.coords.tolist(), self.info_urls)))
+
+    @classmethod
+    def from_df(cls, centros_df):
+        if centros_df.empty: return cls([], np.empty((0, 2)), [])
+        urls = [url if isinstance(url, str) and url else None for url in centros_df['info_url']]
+        return cls(centros_df['nombre_centro'], centros_df[['latitude', 'longitude']].to_numpy(dtype=np.float64), urls)
+
+    @property
+    def empty(self): return len(self.names) == 0
+
+    def __len__(self): return len(self.names)
+
+    def indices(self, names):
+        return tuple(self.positions[n] for n in names if n in self.positions)
+
+    def tour(self, start_coords, indices):
+        """Paradas de un tour: el punto de partida seguido de los puntos de interés `indices`."""
+        return [Stop(-1, NOMBRE_PARTIDA, *start_coords)] + [self.stops[i] for i in indices]
+
+    def frame(self, start_coords, indices):
+        # DataFrame pequeño (solo las paradas del tour) para el optimizador del orden de visita
+        import pandas as pd
+        stops = self.tour(start_coords, indices)
+        return pd.DataFrame({'nombre_centro': [s.nombre_centro for s in stops], 'latitude': [s.latitude for s in stops], 'longitude': [s.longitude for s in stops]})
+
+    def save(self, directory, source_key=None):
+        os.makedirs(directory, exist_ok=True)
+        # Otros procesos pueden tener coords.npy abierto con memory-map: se sustituye el fichero, nunca se reescribe
+        coords = os.path.join(directory, "coords.npy")
+        with open(coords + ".tmp", 'wb') as f: np.save(f, np.asarray(self.coords))
+        os.replace(coords + ".tmp", coords)
+        tmp = os.path.join(directory, "meta.json.tmp")
+        with open(tmp, 'w', encoding='utf-8') as f: json.dump({'names': self.names, 'info_urls': self.info_urls, 'source': source_key}, f, ensure_ascii=False)
+        os.replace(tmp, os.path.join(directory, "meta.json"))
+
+    @classmethod
+    def open(cls, directory, source_key=None):
+        """Abre una tabla guardada con `save` (coordenadas con memory-map). None si no existe o es de otro origen."""
+        try:
+            with open(os.path.join(directory, "meta.json"), encoding='utf-8') as f: meta = json.load(f)
+            if source_key is not None and meta.get('source') != source_key: return None
+            coords = np.load(os.path.join(directory, "coords.npy"), mmap_mode='r')
+            # Abierto justo mientras otro proceso guardaba: meta.json aún es el anterior
+            if coords.shape != (len(meta['names']), 2): return None
+        except (OSError, ValueError):
+            return None
+        return cls(meta['names'], coords, meta['info_urls'])
+
+def load_sites(filepath, directory=SITIOS_DIR):
+    """
+    Tabla de puntos de interés de `filepath`. Se reutiliza la copia de `directory` mientras el
+    fichero de origen no cambie; si no, se regenera a partir de load_centros.
+    """
+    try:
+        stat = os.stat(filepath)
+        source_key = f"{os.path.abspath(filepath)}:{stat.st_size}:{stat.st_mtime_ns}"
+    except OSError:
+        return SiteTable.from_df(load_centros(filepath))
+    table = SiteTable.open(directory, source_key)
+    if table is not None: return table
+    table = SiteTable.from_df(load_centros(filepath))
+    if table.empty: return table
+    try:
+        table.save(directory, source_key)
+        return SiteTable.open(directory, source_key) or table
+    except OSError:
+        return table
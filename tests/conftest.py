@@ -0,0 +1,24 @@
+import os
+import sys
+import pytest
+
+RAIZ = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, RAIZ)
+sys.path.insert(0, os.path.join(RAIZ, 'benchmarks'))
+from servidor_falso import FakeAPIServer
+
+def recurso(i, editado="2024-01-01T08:00:00+00:00", nombre=None):
+    """Registro con el formato de la API v1 de recursos turísticos."""
+    return {"recordid": f"r{i}", "fields": {
+        "globalid": f"{{G-{i}}}", "objectid": i, "nombre": nombre or f"{i} - Recurso {i}",
+        "informacion_recurso": f"https://www.valencia.es/recurso/{i}", "geo_point_2d": [39.46 + i / 1000, -0.37 - i / 1000],
+        "geo_shape": {"type": "Point", "coordinates": [-0.37 - i / 1000, 39.46 + i / 1000]},
+        "last_edited_date": editado, "created_date": "2024-09-06T09:26:21+00:00"}}
+
+@pytest.fixture
+def servidor_turismo():
+    """El servidor falso de los benchmarks, sin latencia y con 250 recursos sintéticos en /turismo."""
+    servidor = FakeAPIServer(latency_ms=0)
+    servidor.turismo = [recurso(i) for i in range(1, 251)]
+    yield servidor.start()
+    servidor.stop()
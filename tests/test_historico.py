@@ -0,0 +1,69 @@
+import os
+from datetime import datetime, timedelta, timezone
+import numpy as np
+import pandas as pd
+from disponibilidad import AvailabilitySnapshot
+from historico import FICHERO_DIA, AvailabilityForecaster, ForecasterUpdater, HistoricalStore, franja
+
+LUNES = datetime(2024, 9, 2, 6, 0, tzinfo=timezone.utc)  # 08:00 en Valencia
+
+def foto(when, bicis, numeros=("1", "2")):
+    """Foto sintética: cada estación con `bicis` bicis y 20 - `bicis` bornes libres."""
+    df = pd.DataFrame({'numero_estacion': list(numeros), 'latitude': 39.47, 'longitude': -0.37, 'bicis_disponibles': bicis, 'bornes_libres': 20 - bicis})
+    return AvailabilitySnapshot(df, fetched_at=when)
+
+def test_compacta_los_dias_cerrados(tmp_path):
+    store = HistoricalStore(str(tmp_path), retention_days=60)
+    for i in range(12): store.append(foto(LUNES + timedelta(minutes=5 * i), i))
+    carpeta = tmp_path / "dia=2024-09-02"
+    assert len(os.listdir(carpeta)) == 12
+
+    store.append(foto(LUNES + timedelta(days=1), 3))
+    # El lunes queda en un único fichero; el martes sigue abierto con su foto suelta
+    assert os.listdir(carpeta) == [FICHERO_DIA]
+    assert os.listdir(tmp_path / "dia=2024-09-03")[0].startswith("foto_")
+    history = store.load()
+    assert len(history) == 13 * 2
+    assert sorted(history.loc[history['timestamp'] < LUNES + timedelta(days=1), 'bicis_disponibles'].unique()) == list(range(12))
+
+def test_compacta_al_arrancar_y_borra_lo_antiguo(tmp_path):
+    HistoricalStore(str(tmp_path)).append(foto(LUNES, 5))
+    HistoricalStore(str(tmp_path)).append(foto(LUNES + timedelta(minutes=5), 6))
+    # Un proceso nuevo compacta en su primera foto los días que quedaron sin compactar
+    store = HistoricalStore(str(tmp_path), retention_days=7)
+    store.append(foto(LUNES + timedelta(days=2), 7))
+    assert os.listdir(tmp_path / "dia=2024-09-02") == [FICHERO_DIA] and len(store.load()) == 6
+    store.append(foto(LUNES + timedelta(days=8), 8))
+    assert store.partitions() == ["dia=2024-09-04", "dia=2024-09-10"]
+    assert len(store.load(since=LUNES + timedelta(days=5))) == 2
+
+def test_prevision_sigue_la_variacion_estacional():
+    # Cuatro lunes: a las 08:00 hay 10 bicis y a las 08:15 solo 4 en la estación 1
+    fotos = [foto(LUNES + timedelta(weeks=w, minutes=m), b, numeros=("1",)) for w in range(4) for m, b in ((0, 10), (15, 4))]
+    history = pd.concat([pd.DataFrame({'timestamp': f.fetched_at, 'numero_estacion': f.df['numero_estacion'], 'bicis_disponibles': f.df['bicis_disponibles'], 'bornes_libres': f.df['bornes_libres']}) for f in fotos], ignore_index=True)
+    forecaster = AvailabilityForecaster.fit(history)
+    assert forecaster.seasonal['bicis_disponibles'][0, 0, franja(LUNES)[1]] == 10
+
+    ahora = foto(LUNES + timedelta(weeks=5, minutes=5), np.array([8, 3]), numeros=("1", "99"))
+    previstas = forecaster.forecast(ahora.index, 'bicis_disponibles', 12, now=ahora.fetched_at)
+    # La estación 1 pierde 6 bicis al cruzar a la franja de las 08:15; la 99 no tiene histórico
+    assert previstas.tolist() == [2.0, 3.0]
+    assert forecaster.forecast(ahora.index, 'bicis_disponibles', 5, now=ahora.fetched_at).tolist() == [8.0, 3.0]
+    assert forecaster.forecast(ahora.index, 'bornes_libres', np.array([12, 12]), now=ahora.fetched_at).tolist() == [18.0, 17.0]
+
+def test_prevision_sin_historico():
+    assert AvailabilityForecaster.fit(HistoricalStore("no_existe").load()) is None
+
+def test_recalcula_en_segundo_plano(tmp_path):
+    store = HistoricalStore(str(tmp_path))
+    updater = ForecasterUpdater(str(tmp_path), days=100000, max_age=3600)
+    updater.start()._thread.join()
+    assert updater.get() is None  # todavía no hay histórico
+
+    store.append(foto(LUNES, 5))
+    updater(None)
+    assert updater._thread.is_alive() is False and updater.get() is None  # la previsión aún es reciente
+
+    updater.max_age = 0
+    updater.update().join()
+    assert isinstance(updater.get(), AvailabilityForecaster)
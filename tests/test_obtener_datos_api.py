@@ -0,0 +1,52 @@
+import os
+import pandas as pd
+from conftest import recurso
+from datos import load_centros
+from obtener_datos_api import generar_datos_desde_api, tipar_recursos
+
+def generar(servidor, path, **kwargs):
+    return generar_datos_desde_api(output_parquet=str(path), api_url=f"{servidor.url}/turismo", max_workers=2, peticiones_por_segundo=0, **kwargs)
+
+def test_reanuda_tras_un_fallo(servidor_turismo, tmp_path):
+    path = tmp_path / "recursos.parquet"
+    servidor_turismo.fallos['turismo'] = {200}
+    assert not generar(servidor_turismo, path)
+    assert os.path.exists(f"{path}.checkpoint.json") and not path.exists()
+
+    descargadas = set(servidor_turismo.paginas['turismo']) - {200}
+    servidor_turismo.paginas.clear()
+    assert generar(servidor_turismo, path)
+    # Solo se vuelven a pedir las páginas que no se completaron
+    assert not descargadas & set(servidor_turismo.paginas['turismo'])
+    df = pd.read_parquet(path)
+    assert len(df) == 250 and df['globalid'].is_unique
+    assert not os.path.exists(f"{path}.checkpoint.json") and not os.path.exists(f"{path}.parcial.jsonl")
+
+def test_incremental_sustituye_por_globalid(servidor_turismo, tmp_path):
+    path = tmp_path / "recursos.parquet"
+    servidor_turismo.turismo[-1] = recurso(250, editado="2024-09-06T09:26:21+00:00")
+    assert generar(servidor_turismo, path)
+    servidor_turismo.turismo[4] = recurso(5, editado="2025-01-01T10:00:00+00:00", nombre="5 - Recurso renombrado")
+    servidor_turismo.turismo.append(recurso(251, editado="2025-01-01T10:00:00+00:00"))
+    servidor_turismo.paginas.clear()
+
+    assert generar(servidor_turismo, path, incremental=True)
+    # Solo se piden los editados desde el último last_edited_date guardado: caben en una página
+    assert servidor_turismo.paginas['turismo'] == [0]
+    df = pd.read_parquet(path)
+    assert len(df) == 251 and df['globalid'].is_unique
+    assert df.loc[df['globalid'] == "{G-5}", 'nombre'].item() == "5 - Recurso renombrado"
+
+def test_parquet_legible_por_load_centros(servidor_turismo, tmp_path):
+    path = tmp_path / "recursos.parquet"
+    assert generar(servidor_turismo, path)
+    centros = load_centros(str(path))
+    assert len(centros) == 250
+    fila = centros[centros['nombre_centro'] == "Recurso 7"].iloc[0]
+    assert (fila['latitude'], fila['longitude']) == (39.467, -0.377)
+
+def test_geo_point_en_texto_como_en_el_csv():
+    df = tipar_recursos(pd.DataFrame({'geo_point_2d': ["[39.47, -0.37]", [39.5, -0.4], {'lat': 39.4, 'lon': -0.3}, None]}))
+    assert df['latitude'].tolist()[:3] == [39.47, 39.5, 39.4]
+    assert df['geo_point_2d'].tolist()[:3] == ["[39.47, -0.37]", "[39.5, -0.4]", "[39.4, -0.3]"]
+    assert pd.isna(df['latitude'].iloc[3])